@@ -0,0 +1,95 @@
+"""
+lamindex 每轮对话的 Agent 构建开销：加载 50 个工具时，每轮准备 AgentWorkflow 的耗时。
+
+对比两种方式：
+- rebuild: 旧的 chat 步骤写法，每轮调用 AgentWorkflow.from_tools_or_functions
+- cached: ConversationalAgent._get_workflow()，按工具和系统提示词的指纹复用
+
+用法: python benchmarks/bench_agent_setup.py [轮数] [工具数]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from llama_index.core.agent.workflow import AgentWorkflow
+from llama_index.core.tools import FunctionTool
+
+import lamindex
+from util import compile_schema
+
+
+def make_tools(count: int) -> list:
+    tools = []
+    for i in range(count):
+
+        async def tool_fn(**kwargs):
+            return "ok"
+
+        input_schema = {
+            "type": "object",
+            "properties": {
+                "level": {"type": "integer", "description": f"level of device {i}"},
+                "mode": {"type": "string", "description": "working mode"},
+            },
+            "required": ["level"],
+        }
+        tools.append(
+            FunctionTool.from_defaults(
+                fn=tool_fn,
+                async_fn=tool_fn,
+                name=f"tool_{i}",
+                description=f"Control device {i} of the robot.",
+                fn_schema=compile_schema(f"tool_{i}", input_schema),
+            )
+        )
+    return tools
+
+
+def run_rebuild(agent, turns: int):
+    for _ in range(turns):
+        AgentWorkflow.from_tools_or_functions(
+            tools_or_functions=agent.tools,
+            llm=agent.llm,
+            system_prompt=agent.system_prompt,
+            verbose=False,
+            timeout=agent.turn_timeout,
+        )
+
+
+def run_cached(agent, turns: int):
+    for _ in range(turns):
+        agent._get_workflow(agent.llm)
+
+
+def measure(fn, agent, turns: int) -> float:
+    start = time.perf_counter()
+    fn(agent, turns)
+    return (time.perf_counter() - start) / turns
+
+
+def main(turns: int, tool_count: int):
+    agent = lamindex.ConversationalAgent()
+    agent.tools = make_tools(tool_count)
+
+    # 预热：导入、pydantic 模型等一次性开销不计入
+    run_rebuild(agent, 1)
+    run_cached(agent, 1)
+
+    rebuild = measure(run_rebuild, agent, turns)
+    cached = measure(run_cached, agent, turns)
+
+    print(f"turns: {turns}, tools: {tool_count}")
+    print(f"rebuild: {rebuild * 1e6:10.1f} us/turn")
+    print(
+        f"cached:  {cached * 1e6:10.1f} us/turn  ({rebuild / cached:.0f}x faster)"
+    )
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+    )
@@ -0,0 +1,74 @@
+"""
+并发会话基准：N 个会话同时对本地桩 LLM 发起一轮对话。
+
+对比两种方式：
+- blocking: 在协程中消费同步 OpenAI 客户端的流（旧的 call_openai 写法），
+  整个事件循环在每个流期间被阻塞，N 个会话只能串行完成。
+- async: ConversationalAgent 使用 AsyncOpenAI 的异步流，N 个会话共用一个事件循环并发完成。
+
+用法: python benchmarks/bench_concurrent_chat.py [N]
+"""
+
+import os
+import sys
+import time
+
+import anyio
+from openai import AsyncOpenAI, OpenAI
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# main 模块导入时会创建默认 LLM 客户端，桩服务不校验 key
+os.environ.setdefault("DASHSCOPE_API_KEY", "stub")
+
+from stub_llm_server import StubLLMServer
+from main import ConversationalAgent
+
+
+async def blocking_chat(llm: OpenAI, query: str) -> str:
+    stream = llm.chat.completions.create(
+        model="stub",
+        messages=[{"role": "user", "content": query}],
+        stream=True,
+    )
+    parts = []
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+    return "".join(parts)
+
+
+async def run_concurrently(n: int, make_chat) -> float:
+    start = time.perf_counter()
+    async with anyio.create_task_group() as tg:
+        for i in range(n):
+            tg.start_soon(make_chat(i))
+    return time.perf_counter() - start
+
+
+async def main(n: int):
+    with StubLLMServer(first_token_delay=0.2, chunk_delay=0.02) as server:
+        sync_llm = OpenAI(api_key="stub", base_url=server.base_url)
+        async_llm = AsyncOpenAI(api_key="stub", base_url=server.base_url)
+
+        # 预热连接
+        await blocking_chat(sync_llm, "hi")
+
+        agents = [ConversationalAgent("stub", async_llm) for _ in range(n)]
+        for agent in agents:
+            await agent.init()
+
+        one_turn = await run_concurrently(1, lambda i: lambda: agents[0].chat("你好"))
+
+        blocking = await run_concurrently(
+            n, lambda i: lambda: blocking_chat(sync_llm, "你好")
+        )
+        concurrent = await run_concurrently(n, lambda i: lambda: agents[i].chat("你好"))
+
+    print(f"sessions: {n}")
+    print(f"one turn:            {one_turn * 1000:8.1f} ms")
+    print(f"blocking x{n:<4}      {blocking * 1000:8.1f} ms  ({blocking / one_turn:.1f} turns)")
+    print(f"async    x{n:<4}      {concurrent * 1000:8.1f} ms  ({concurrent / one_turn:.1f} turns)")
+
+
+if __name__ == "__main__":
+    anyio.run(main, int(sys.argv[1]) if len(sys.argv) > 1 else 20)
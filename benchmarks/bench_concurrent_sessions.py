@@ -0,0 +1,114 @@
+"""
+lamindex 并发会话测试：一个 ConversationalAgent 实例同时处理 N 个设备的对话。
+
+每个会话连续对话两轮，每一轮 N 个 run(user_input=..., session_id=...) 同时进行。检查：
+- 每个请求里只出现本会话的消息，第二轮带上了本会话第一轮的上下文
+- 每个会话的历史只记录了自己的两轮对话
+- N 个并发 run 的耗时接近单轮耗时，而不是 N 倍
+
+用法: python benchmarks/bench_concurrent_sessions.py [N]
+"""
+
+import os
+import re
+import sys
+import time
+
+import anyio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stub_llm_server import StubLLMServer
+
+import lamindex
+
+REPLY = "好的呀"
+
+
+class StubAgent(lamindex.ConversationalAgent):
+    """所有模型都指向本地桩服务"""
+
+    def __init__(self, base_url: str, **kwargs):
+        self.base_url = base_url
+        super().__init__(**kwargs)
+
+    def _create_llm(self, model: str):
+        llm = super()._create_llm(model)
+        llm.api_base = self.base_url
+        return llm
+
+
+async def run_turn(agent, session_id: str, text: str, replies: dict):
+    handler = agent.run(user_input=text, session_id=session_id)
+    async for event in handler.stream_events():
+        if isinstance(event, lamindex.MessageEvent):
+            replies.setdefault(session_id, []).append(event.message)
+    await handler
+
+
+async def run_round(agent, n: int, turn: int, replies: dict) -> float:
+    start = time.perf_counter()
+    async with anyio.create_task_group() as tg:
+        for i in range(n):
+            tg.start_soon(run_turn, agent, f"device-{i}", f"设备{i}第{turn}句", replies)
+    return time.perf_counter() - start
+
+
+def check(agent, server, n: int, replies: dict):
+    # 每个请求中的用户消息都来自同一个设备
+    for request in server.requests:
+        devices = {
+            re.match(r"设备(\d+)", message["content"]).group(1)
+            for message in request["messages"]
+            if message["role"] == "user"
+        }
+        assert len(devices) == 1, f"messages of several sessions mixed: {devices}"
+
+    second_turns = [
+        request
+        for request in server.requests
+        if request["messages"][-1]["content"].endswith("第2句")
+    ]
+    assert len(second_turns) == n, len(second_turns)
+    for request in second_turns:
+        contents = [message["content"] for message in request["messages"]]
+        device = re.match(r"设备(\d+)", contents[-1]).group(1)
+        assert contents[-3:-1] == [f"设备{device}第1句", REPLY], contents
+
+    assert len(agent.sessions) == n
+    for session_id, session in agent.sessions.items():
+        contents = [message.content for message in session.history]
+        device = session_id.split("-")[1]
+        expected = [f"设备{device}第1句", REPLY, f"设备{device}第2句", REPLY]
+        assert contents == expected, contents
+        assert replies[session_id] == [REPLY, REPLY], replies[session_id]
+
+
+async def main(n: int):
+    with StubLLMServer(reply=REPLY, first_token_delay=0.2, chunk_delay=0.02) as server:
+        agent = StubAgent(server.base_url)
+
+        # 预热：连接和 AgentWorkflow 的构建不计入
+        warmup = {}
+        await run_turn(agent, "warmup", "设备0第0句", warmup)
+        agent.sessions.clear()
+        server.requests.clear()
+
+        one_turn = await run_round(agent, 1, 0, {})
+        agent.sessions.clear()
+        server.requests.clear()
+
+        replies = {}
+        first = await run_round(agent, n, 1, replies)
+        second = await run_round(agent, n, 2, replies)
+        check(agent, server, n, replies)
+
+    print(f"sessions: {n}, one agent instance")
+    print(f"one turn:           {one_turn * 1000:8.1f} ms")
+    print(f"round 1 x{n:<4}      {first * 1000:8.1f} ms  ({first / one_turn:.1f} turns)")
+    print(f"round 2 x{n:<4}      {second * 1000:8.1f} ms  ({second / one_turn:.1f} turns)")
+    print("sessions isolated: ok")
+
+
+if __name__ == "__main__":
+    anyio.run(main, int(sys.argv[1]) if len(sys.argv) > 1 else 50)
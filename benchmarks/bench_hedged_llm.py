@@ -0,0 +1,85 @@
+"""
+对冲请求基准：两个本地桩 LLM 服务，注入不同的首 token 延迟。
+
+场景：
+- slow primary: 主端点首 token 需要 2 秒，备用端点 0.1 秒
+- failed primary: 主端点不可用（端口未监听），立即切换到备用端点
+- healthy primary: 主端点正常，不触发对冲
+
+每个场景对比仅使用主端点与 HedgedLLM（首 token 截止时间 0.3 秒）的首 token 耗时。
+
+用法: python benchmarks/bench_hedged_llm.py
+"""
+
+import os
+import socket
+import sys
+import time
+
+import anyio
+from openai import AsyncOpenAI
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stub_llm_server import StubLLMServer
+from util import AllEndpointsFailed, HedgedLLM, LLMEndpoint
+
+DEADLINE = 0.3
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def client(base_url: str) -> AsyncOpenAI:
+    return AsyncOpenAI(api_key="stub", base_url=base_url, max_retries=0)
+
+
+async def first_token(llm: HedgedLLM) -> tuple:
+    start = time.perf_counter()
+    first = None
+    model = None
+    try:
+        async for chunk in llm.stream(messages=MESSAGES):
+            if first is None:
+                first = time.perf_counter() - start
+                model = chunk.model
+    except AllEndpointsFailed:
+        return None, "failed"
+    return first, model
+
+
+async def scenario(name: str, primary_url: str, backup_url: str):
+    primary = LLMEndpoint(client(primary_url), "primary")
+    backup = LLMEndpoint(client(backup_url), "backup")
+
+    single, single_model = await first_token(HedgedLLM([primary], DEADLINE))
+    hedged_llm = HedgedLLM([primary, backup], DEADLINE)
+    hedged, hedged_model = await first_token(hedged_llm)
+
+    single_text = f"{single * 1000:7.1f} ms" if single is not None else "  failed  "
+    print(
+        f"{name:<16} primary only: {single_text} ({single_model})  "
+        f"hedged: {hedged * 1000:7.1f} ms ({hedged_model})  "
+        f"hedges={hedged_llm.stats.hedged} fallbacks={hedged_llm.stats.fallbacks}"
+    )
+
+
+async def main():
+    with StubLLMServer(first_token_delay=2.0) as slow, StubLLMServer(
+        first_token_delay=0.1
+    ) as fast:
+        # 预热连接
+        await first_token(HedgedLLM([LLMEndpoint(client(fast.base_url), "warmup")]))
+
+        await scenario("slow primary", slow.base_url, fast.base_url)
+        dead_url = f"http://127.0.0.1:{unused_port()}/v1"
+        await scenario("failed primary", dead_url, fast.base_url)
+        await scenario("healthy primary", fast.base_url, slow.base_url)
+
+
+if __name__ == "__main__":
+    anyio.run(main)
@@ -0,0 +1,73 @@
+"""
+消息对象内存基准：10k 个常驻会话的 Message / ToolDefinition 内存占用。
+
+每个会话包含一条 system 消息、若干轮对话和一组工具定义。系统提示词和工具描述
+按会话各自加载（模拟从文件或 list_tools 读取），对比：
+- before: 带 __dict__ 的旧 Message 与普通 dataclass ToolDefinition
+- after: __slots__ 的 Message（system 内容 intern）与 slots ToolDefinition（名称和描述 intern）
+
+用法: python benchmarks/bench_message_memory.py [会话数]
+"""
+
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from legacy_types import LegacyMessage, LegacyToolDefinition
+from tool_description import Message, ToolDefinition
+
+SYSTEM_PROMPT_LINES = [
+    "在这个对话中，你将扮演一个情感助手。",
+    "你有视觉能力，当你被问视觉相关问题时，你可以调用 explain_photo 这个工具。",
+    "根据我提供的问题，生成一个富有温度的回应。",
+]
+TOOLS = [
+    ("take_photo", "Take a photo with the device camera and return the image."),
+    ("set_volume", "Set the speaker volume of the device, from 0 to 100."),
+    ("get_battery", "Get the current battery level of the device."),
+]
+TURNS = 3
+
+
+def load_prompt() -> str:
+    # 每次都构造新的字符串对象，相当于每个会话各自读取一次提示词文件
+    return "\n".join(SYSTEM_PROMPT_LINES)
+
+
+def build_session(i: int, message_cls, tool_cls) -> tuple:
+    messages = [message_cls(role="system", content=load_prompt())]
+    for turn in range(TURNS):
+        messages.append(message_cls(role="user", content=f"会话 {i} 第 {turn} 轮"))
+        messages.append(message_cls(role="assistant", content=f"回复 {turn}"))
+    tools = [
+        tool_cls(name="".join(name), description="".join(desc))
+        for name, desc in TOOLS
+    ]
+    return messages, tools
+
+
+def measure(sessions: int, message_cls, tool_cls) -> int:
+    gc.collect()
+    tracemalloc.start()
+    resident = [build_session(i, message_cls, tool_cls) for i in range(sessions)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del resident
+    return current
+
+
+def main(sessions: int):
+    before = measure(sessions, LegacyMessage, LegacyToolDefinition)
+    after = measure(sessions, Message, ToolDefinition)
+
+    print(f"sessions: {sessions}")
+    print(f"before: {before / 2**20:8.2f} MiB  ({before / sessions:7.0f} B/session)")
+    print(f"after:  {after / 2**20:8.2f} MiB  ({after / sessions:7.0f} B/session)")
+    print(f"saved:  {(before - after) / before:.0%}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
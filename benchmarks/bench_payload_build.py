@@ -0,0 +1,111 @@
+"""
+请求消息构建基准：200 轮对话中每轮构建 messages 参数的开销。
+
+对比两种方式：
+- rebuild: 旧的 call_openai 写法，每轮对全部历史消息做 __dict__.copy() 和字典推导
+- window: DialogueWindow.payload()，历史消息只在写入时序列化一次
+
+用法: python benchmarks/bench_payload_build.py [轮数]
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from legacy_types import LegacyMessage, legacy_message_to_dict
+from tool_description import Message
+from util import DialogueWindow
+
+SYSTEM_PROMPT = "在这个对话中，你将扮演一个情感助手。" * 5
+
+
+def turn_messages(i: int, message_cls=Message) -> list:
+    """每轮：用户提问、带工具调用的 assistant、工具结果、最终回复"""
+    call_id = f"call_{i}"
+    return [
+        message_cls(role="user", content=f"第 {i} 个问题，你看看我今天打扮得怎么样"),
+        message_cls(
+            role="assistant",
+            tool_calls=[
+                {
+                    "id": call_id,
+                    "function": {"arguments": "{}", "name": "take_photo"},
+                    "type": "function",
+                    "index": 0,
+                }
+            ],
+        ),
+        message_cls(role="tool", tool_call_id=call_id, content=f"photo {i}"),
+        message_cls(role="assistant", content=f"第 {i} 轮回复：今天很精神！"),
+    ]
+
+
+def run_rebuild(turns: int):
+    dialogue = [LegacyMessage(role="system", content=SYSTEM_PROMPT)]
+    payloads = []
+    for i in range(turns):
+        payload = [legacy_message_to_dict(m) for m in dialogue]
+        payload.append(
+            legacy_message_to_dict(LegacyMessage(role="user", content="q"))
+        )
+        payloads.append(payload)
+        dialogue.extend(turn_messages(i, LegacyMessage))
+    return payloads
+
+
+def run_window(turns: int):
+    dialogue = DialogueWindow(max_tokens=10**9, message_factory=Message)
+    dialogue.append(Message(role="system", content=SYSTEM_PROMPT))
+    payloads = []
+    for i in range(turns):
+        payload = dialogue.payload() + [{"role": "user", "content": "q"}]
+        payloads.append(payload)
+        dialogue.extend(turn_messages(i))
+    return payloads
+
+
+def measure(fn, turns: int):
+    start = time.perf_counter()
+    fn(turns)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    payloads = fn(turns)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, payloads
+
+
+def prefix_stable(payloads) -> bool:
+    """每轮请求体都以上一轮请求体（去掉末尾用户消息）为前缀"""
+    previous = None
+    for payload in payloads:
+        body = json.dumps(payload[:-1], ensure_ascii=False)
+        if previous is not None and not body.startswith(previous[:-1]):
+            return False
+        previous = body
+    return True
+
+
+def main(turns: int):
+    rebuild_time, rebuild_peak, rebuild_payloads = measure(run_rebuild, turns)
+    window_time, window_peak, window_payloads = measure(run_window, turns)
+    assert rebuild_payloads[-1] == window_payloads[-1]
+
+    print(f"turns: {turns}")
+    print(
+        f"rebuild: {rebuild_time * 1000:8.2f} ms  peak {rebuild_peak / 1024:8.1f} KiB"
+    )
+    print(
+        f"window:  {window_time * 1000:8.2f} ms  peak {window_peak / 1024:8.1f} KiB"
+        f"  ({rebuild_time / window_time:.1f}x faster)"
+    )
+    print(f"prefix stable: {prefix_stable(window_payloads)}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,108 @@
+"""
+每轮工具筛选的效果：多台设备共暴露几十个工具时，每轮发给 LLM 的工具 schema 的 token 数。
+
+对比两种方式：
+- full: 每轮发送完整的工具目录（原始 schema）
+- selected: ToolSelector 只发送相关的 top-k 工具和固定工具，schema 精简后发送
+
+同时输出每句话选中的工具，以及每轮筛选本身的耗时。
+
+用法: python benchmarks/bench_tool_selector.py [轮数] [舵机数]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from util import ToolSelector, compile_schema
+
+DEVICE_TOOLS = [
+    ("take_photo", "Take a photo with the camera 拍照", {}),
+    ("set_volume", "设置扬声器音量 Set the speaker volume", {"volume": "integer"}),
+    ("get_volume", "获取当前音量", {}),
+    ("set_brightness", "设置屏幕亮度 Set the brightness", {"brightness": "integer"}),
+    ("turn_on_light", "打开灯 Turn on the light", {}),
+    ("turn_off_light", "关闭灯 Turn off the light", {}),
+    ("get_battery", "查询电量 Battery level", {}),
+    ("get_weather", "查询城市的天气预报 Weather forecast of a city", {"city": "string"}),
+    ("get_time", "现在几点 Current time", {}),
+    ("play_music", "播放音乐 Play a song", {"song": "string"}),
+    ("stop_music", "停止播放音乐 Stop the music", {}),
+    ("set_alarm", "设置闹钟 Set an alarm clock", {"time": "string"}),
+    ("get_temperature", "室内温度 Indoor temperature", {}),
+    ("reboot", "重启设备 Reboot the device", {}),
+]
+
+QUERIES = [
+    "你看看我今天打扮得怎么样",
+    "把音量调大一点",
+    "开灯",
+    "今天北京天气怎么样",
+    "现在几点了",
+    "你好呀",
+    "播放一首歌",
+    "把3号舵机转到90度",
+    "电量还有多少",
+]
+
+
+def make_tools(servos: int) -> list:
+    specs = list(DEVICE_TOOLS)
+    for i in range(servos):
+        description = f"舵机{i}转动到指定角度 Move servo {i} to an angle"
+        specs.append((f"servo_{i}_move", description, {"angle": "number"}))
+
+    tools = []
+    for name, description, parameters in specs:
+        schema = {
+            "type": "object",
+            "properties": {key: {"type": value} for key, value in parameters.items()},
+        }
+        # 与 pydantic/FastMCP 生成的 schema 一样带 title 等字段
+        schema = compile_schema(name, schema).model_json_schema()
+        tools.append(
+            {
+                "type": "function",
+                "function": {
+                    "name": name,
+                    "description": description,
+                    "parameters": schema,
+                },
+            }
+        )
+    return tools
+
+
+def main(rounds: int, servos: int):
+    tools = make_tools(servos)
+    selector = ToolSelector(pinned=("take_photo",))
+
+    for query in QUERIES:
+        selection = selector.select(query, tools)
+        print(
+            f"{query:　<14} {selection.sent_tokens:5d}/{selection.full_tokens} tokens  "
+            f"{selection.names}"
+        )
+
+    start = time.perf_counter()
+    for i in range(rounds):
+        selector.select(QUERIES[i % len(QUERIES)], tools)
+    elapsed = time.perf_counter() - start
+
+    stats = selector.stats()
+    print(f"tools: {len(tools)}, turns: {stats['turns']}")
+    print(f"full:     {stats['full_tokens'] / stats['turns']:8.1f} tokens/turn")
+    print(
+        f"selected: {stats['sent_tokens'] / stats['turns']:8.1f} tokens/turn  "
+        f"(saved {stats['saved_rate']:.0%})"
+    )
+    print(f"select:   {elapsed / rounds * 1e6:8.1f} us/turn")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 30,
+    )
@@ -0,0 +1,31 @@
+"""改为 __slots__ 之前的 Message / ToolDefinition 实现，仅供基准对比"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class LegacyToolDefinition:
+    name: str
+    description: str
+    parameters: Optional[Dict[str, Any]] = None
+
+
+class LegacyMessage:
+    def __init__(
+        self,
+        role: str,
+        content: str = None,
+        uniq_id: str = None,
+        tool_calls=None,
+        tool_call_id=None,
+    ):
+        self.role = role
+        self.content = content
+        self.tool_calls = tool_calls
+        self.tool_call_id = tool_call_id
+
+
+def legacy_message_to_dict(msg):
+    d = msg.__dict__.copy()
+    return {k: v for k, v in d.items() if v is not None}
@@ -0,0 +1,220 @@
+"""
+本地 OpenAI 兼容的流式 LLM 桩服务，供基准脚本使用。
+
+服务运行在独立线程的事件循环中，因此即使调用方阻塞了自己的事件循环，
+桩服务仍能正常响应。
+"""
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from typing import Optional
+
+
+class StubLLMServer:
+    """
+    模拟 /chat/completions 的 SSE 流式接口。
+
+    Args:
+        reply: 回复文本，按 chunk_size 个字符切分成多个 chunk 下发
+        first_token_delay: 首个 chunk 之前的延迟（秒）
+        chunk_delay: 相邻 chunk 之间的延迟（秒）
+        chunk_size: 每个 chunk 的字符数
+        tool_calls: 可选，原生 tool_calls 列表，每项为 {"name": ..., "arguments": ...}；
+            仅对尚未包含 tool 结果的请求返回，带 tool 结果的后续请求返回 reply
+        host: 监听地址
+        port: 监听端口，0 表示随机端口
+    """
+
+    def __init__(
+        self,
+        reply: str = "你好，今天也要开开心心的哦！",
+        first_token_delay: float = 0.2,
+        chunk_delay: float = 0.02,
+        chunk_size: int = 2,
+        tool_calls: Optional[list] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.reply = reply
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.tool_calls = tool_calls
+        self.host = host
+        self.port = port
+        # 收到的请求体，按到达顺序记录
+        self.requests: list[dict] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self) -> "StubLLMServer":
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            # 取消仍保持着的 keep-alive 连接
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+                request = json.loads(body) if body else {}
+                self.requests.append(request)
+                if request.get("stream"):
+                    await self._stream_response(writer, request)
+                else:
+                    await self._json_response(writer, request)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _chunk(self, request: dict, delta: dict, finish_reason=None) -> dict:
+        return {
+            "id": self._completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [
+                {"index": 0, "delta": delta, "finish_reason": finish_reason}
+            ],
+        }
+
+    async def _send(self, writer, payload):
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        event = f"data: {data}\n\n".encode()
+        writer.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+        await writer.drain()
+
+    async def _json_response(self, writer, request: dict):
+        await asyncio.sleep(self.first_token_delay)
+        body = json.dumps(
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": self.reply},
+                        "finish_reason": "stop",
+                    }
+                ],
+            }
+        ).encode()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/json\r\n"
+            + f"Content-Length: {len(body)}\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+
+    async def _stream_response(self, writer, request: dict):
+        self._completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+        )
+        await writer.drain()
+        await asyncio.sleep(self.first_token_delay)
+
+        await self._send(writer, self._chunk(request, {"role": "assistant"}))
+        has_tool_result = any(
+            m.get("role") == "tool" for m in request.get("messages", [])
+        )
+        if self.tool_calls and not has_tool_result:
+            for index, call in enumerate(self.tool_calls):
+                delta = {
+                    "tool_calls": [
+                        {
+                            "index": index,
+                            "id": f"call_{uuid.uuid4().hex[:8]}",
+                            "type": "function",
+                            "function": {
+                                "name": call["name"],
+                                "arguments": call.get("arguments", "{}"),
+                            },
+                        }
+                    ]
+                }
+                await self._send(writer, self._chunk(request, delta))
+                await asyncio.sleep(self.chunk_delay)
+            finish_reason = "tool_calls"
+        else:
+            for i in range(0, len(self.reply), self.chunk_size):
+                delta = {"content": self.reply[i : i + self.chunk_size]}
+                await self._send(writer, self._chunk(request, delta))
+                await asyncio.sleep(self.chunk_delay)
+            finish_reason = "stop"
+
+        await self._send(writer, self._chunk(request, {}, finish_reason))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            usage_chunk = self._chunk(request, {})
+            usage_chunk["choices"] = []
+            prompt_tokens = len(json.dumps(request.get("messages", []))) // 4
+            usage_chunk["usage"] = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(self.reply),
+                "total_tokens": prompt_tokens + len(self.reply),
+            }
+            await self._send(writer, usage_chunk)
+        await self._send(writer, "[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
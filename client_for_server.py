@@ -8,9 +8,10 @@ import sys
 from typing import Dict, Any, Callable, List, Union
 import asyncio
 from mcp_client_init import initialize_mcp_client, get_mcp_tools
-from lamindex import ConversationalAgent
+from lamindex import VISION_TOOL_NAMES, ConversationalAgent
 from llama_index.core.workflow import Context
 from lamindex import FuncCallEvent, MessageEvent
+from util import PhotoPrefetcher, ToolSelector, current_device
 
 
 # 配置日志
@@ -173,7 +174,11 @@ class StdioClientForServer:
         logger.info(f"ASR识别结果: {recognized_text}")
 
         async def _run_and_consume():
+            # 工具在工作流的任务中执行，会继承当前设备，用于区分各设备拍摄的照片
+            current_device.set(device_id)
             handler = self.agent.run(user_input=recognized_text)
+            # 回复按句到达，每句单独送去合成，整轮结束后再发送 finish
+            sentences = 0
             async for ev in handler.stream_events():
                 if isinstance(ev, FuncCallEvent):
                     obj = {
@@ -193,7 +198,8 @@ class StdioClientForServer:
                             },
                         }
                     )
-                elif isinstance(ev, MessageEvent):
+                elif isinstance(ev, MessageEvent) and ev.message:
+                    sentences += 1
                     self.send_to_server(
                         [
                             {
@@ -208,14 +214,16 @@ class StdioClientForServer:
                             }
                         ]
                     )
-                    self.send_to_server(
-                        {
-                            "jsonrpc": "2.0",
-                            "id": self.unique_id,
-                            "method": "tts_and_send_finish",
-                            "params": {"device_id": device_id, "task_id": "aaa"},
-                        }
-                    )
+
+            if sentences:
+                self.send_to_server(
+                    {
+                        "jsonrpc": "2.0",
+                        "id": self.unique_id,
+                        "method": "tts_and_send_finish",
+                        "params": {"device_id": device_id, "task_id": "aaa"},
+                    }
+                )
 
         asyncio.run(_run_and_consume())
 
@@ -450,7 +458,12 @@ def create_agent():
             client_name=client_name, host=host, wait_time=3.0
         )
 
-        agent = ConversationalAgent(mcp_client=mcp_client)
+        # 识别到视觉类问题时提前拍照，与 LLM 推理并行；每轮只发送相关的工具
+        agent = ConversationalAgent(
+            mcp_client=mcp_client,
+            photo_prefetcher=PhotoPrefetcher(),
+            tool_selector=ToolSelector(pinned=VISION_TOOL_NAMES),
+        )
         await agent.load_mcp_tools()
         return agent
 
@@ -1,9 +1,14 @@
 import asyncio
 import anyio
+import base64
+import functools
 import logging
 import re
 import os
-from typing import List, Optional, Union, cast, Any
+import time
+import weakref
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Sequence, Union, cast, Any
 from dataclasses import dataclass
 
 from llama_index.core.agent.workflow import (
@@ -27,13 +32,28 @@ from mcp.shared.mqtt import configure_logging
 import mcp.types as types
 
 from llama_index.llms.siliconflow import SiliconFlow
-from llama_index.core.llms import ChatMessage, MessageRole
-from llama_index.core.tools import BaseTool, FunctionTool
-from llama_index.core.settings import Settings
+from llama_index.core.llms import ChatMessage, MessageRole, TextBlock
+from llama_index.core.tools import BaseTool, FunctionTool, ToolMetadata
 from llama_index.llms.openai_like import OpenAILike
-from pydantic import Field, create_model
 from llama_index.core.tools import ToolOutput
-from openai import OpenAI
+from util import (
+    TIMEOUT_REPLY,
+    ArgumentError,
+    BlobStore,
+    FrameIndex,
+    ModelRouter,
+    PhotoPrefetcher,
+    SentenceSegmenter,
+    ToolSelector,
+    TurnDeadline,
+    VisionService,
+    compile_schema,
+    current_device,
+    minify_tool,
+    render_tool_content,
+    tool_call_budget,
+    validate_arguments,
+)
 
 configure_logging(level="DEBUG")
 logger = logging.getLogger(__name__)
@@ -59,39 +79,140 @@ async def on_mcp_connect(client, server_name, connect_result):
         toolsResult = await client.list_tools(server_name)
         tools = toolsResult.tools
         logger.info(f"Tools of {server_name}: {tools}")
+    watch_tool_list_changed(client, server_name)
+    invalidate_agent_tools(client, server_name)
 
 
 async def on_mcp_disconnect(client, server_name):
     logger.info(f"Disconnected from {server_name}")
+    invalidate_agent_tools(client, server_name)
+
+
+# Agents whose MCP tools are reloaded when their server changes, see
+# invalidate_agent_tools
+_agents: "weakref.WeakSet[ConversationalAgent]" = weakref.WeakSet()
+
+
+def invalidate_agent_tools(client, server_name):
+    """Make every agent using ``client`` reload its tools of ``server_name``"""
+    if server_name != MCP_SERVER_NAME:
+        return
+    for agent in list(_agents):
+        if agent.mcp_client is client:
+            agent.invalidate_tools()
+
+
+def watch_tool_list_changed(client, server_name):
+    """
+    Invalidate the agents' tools on notifications/tools/list_changed of the
+    server's MCP session; other messages still go to the session's handler.
+    """
+    session = client.get_session(server_name)
+    if session is None or getattr(session, "_tool_list_watched", False):
+        return
+
+    original_handler = getattr(session, "_message_handler", None)
+
+    async def message_handler(message):
+        notification = getattr(message, "root", message)
+        if isinstance(notification, types.ToolListChangedNotification):
+            logger.info(f"Tools of {server_name} changed")
+            invalidate_agent_tools(client, server_name)
+        if original_handler is not None:
+            await original_handler(message)
+
+    session._message_handler = message_handler
+    session._tool_list_watched = True
 
 
 client = None
 api_key = "sk-******"
 
+MCP_SERVER_NAME = "ESP32 Demo Server"
 
-def build_fn_schema_from_input_schema(model_name: str, input_schema: dict):
-    """Build a Pydantic model from JSON Schema's properties/required so params are top-level.
+# Tools a ToolSelector should send in every turn, the vision prompt relies on them
+VISION_TOOL_NAMES = ("take_photo", "explain_photo", "look_and_explain")
 
-    We relax nested types to Any. Required controls whether a field is required.
-    """
-    props = (input_schema or {}).get("properties", {}) or {}
-    required = set((input_schema or {}).get("required", []) or [])
+# Images and resources returned by tools; the conversation only keeps handles
+blob_store = BlobStore()
+
+# Shared by every agent in the process: one pooled client, bounded concurrency.
+# Answers are reused for near-identical frames of the same device.
+vision_service = VisionService(
+    api_key=api_key,
+    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+    model="qwen-vl-plus",
+    frame_index=FrameIndex(),
+    blob_store=blob_store,
+)
 
-    fields = {}
-    for key, prop in props.items():
-        desc = prop.get("description") if isinstance(prop, dict) else None
-        default = ... if key in required else None
-        fields[key] = (Any, Field(default=default, description=desc))
 
-    class_name = re.sub(r"\W+", "_", f"{model_name}Params")
-    return create_model(class_name, **fields)
+_IMAGE_REF = re.compile(
+    r"(data:image/[^\s\"']+|https?://[^\s\"']+|file://[^\s\"']+)"
+)
 
 
-async def get_mcp_tools(mcp_client: mcp_mqtt.MqttTransportClient) -> List[BaseTool]:
+async def _result_image_bytes(result) -> Optional[bytes]:
+    """Bytes of the first image in a tool result, inline or referenced by URL"""
+    for item in getattr(result, "content", None) or []:
+        try:
+            if getattr(item, "type", None) == "image":
+                return base64.b64decode(cast(types.ImageContent, item).data)
+            if getattr(item, "type", None) == "text":
+                match = _IMAGE_REF.search(cast(types.TextContent, item).text)
+                if match:
+                    return await vision_service.fetch_image(match.group(1))
+        except Exception as e:
+            logger.warning(f"cannot read image from tool result: {e}")
+    return None
+
+
+async def take_photo_burst(mcp_client, server_name: str, arguments: dict, frames: int):
+    """Take ``frames`` photos in a row and return the result of the sharpest one"""
+    results = []
+    for _ in range(frames):
+        result = await mcp_client.call_tool(server_name, "take_photo", arguments)
+        if result is not False:
+            results.append(result)
+    if len(results) <= 1:
+        return results[0] if results else False
+
+    images = [await _result_image_bytes(result) for result in results]
+    index = await vision_service.best_frame(images)
+    logger.info(f"burst of {len(results)} photos, using photo {index}")
+    return results[index if index is not None else 0]
+
+
+async def capture_photo(
+    mcp_client,
+    arguments: dict,
+    burst_frames: int = 1,
+    prefetcher: Optional[PhotoPrefetcher] = None,
+):
+    """Call take_photo, served from a fresh prefetched photo when there is one"""
+
+    async def capture():
+        if burst_frames > 1:
+            return await take_photo_burst(
+                mcp_client, MCP_SERVER_NAME, arguments, burst_frames
+            )
+        return await mcp_client.call_tool(MCP_SERVER_NAME, "take_photo", arguments)
+
+    # The prefetch is taken without arguments
+    if prefetcher is not None and not arguments:
+        return await prefetcher.take(capture)
+    return await capture()
+
+
+async def get_mcp_tools(
+    mcp_client: mcp_mqtt.MqttTransportClient,
+    burst_frames: int = 1,
+    prefetcher: Optional[PhotoPrefetcher] = None,
+) -> List[BaseTool]:
     all_tools = []
     try:
         try:
-            tools_result = await mcp_client.list_tools("ESP32 Demo Server")
+            tools_result = await mcp_client.list_tools(MCP_SERVER_NAME)
 
             if tools_result is False:
                 return all_tools
@@ -102,46 +223,34 @@ async def get_mcp_tools(mcp_client: mcp_mqtt.MqttTransportClient) -> List[BaseTo
             for tool in tools:
                 logger.info(f"tool: {tool.name} - {tool.description}")
 
-                def create_mcp_tool_wrapper(client_ref, server_name, tool_name):
+                def create_mcp_tool_wrapper(
+                    client_ref, server_name, tool_name, fn_schema
+                ):
                     async def mcp_tool_wrapper(**kwargs):
                         try:
-                            result = await client_ref.call_tool(
-                                server_name, tool_name, kwargs
-                            )
+                            # Bad arguments fail here instead of on the device
+                            kwargs = validate_arguments(fn_schema, kwargs)
+                            # The agent runs tools in its own tasks, outside the
+                            # turn's cancel scope; bound the call by the budget left
+                            with anyio.fail_after(tool_call_budget()):
+                                if tool_name == "take_photo":
+                                    result = await capture_photo(
+                                        client_ref, kwargs, burst_frames, prefetcher
+                                    )
+                                else:
+                                    result = await client_ref.call_tool(
+                                        server_name, tool_name, kwargs
+                                    )
                             if result is False:
                                 return f"call {tool_name} failed"
 
                             call_result = cast(types.CallToolResult, result)
 
                             if hasattr(call_result, "content") and call_result.content:
-                                content_parts = []
-                                for content_item in call_result.content:
-                                    if hasattr(content_item, "type"):
-                                        if content_item.type == "text":
-                                            text_content = cast(
-                                                types.TextContent, content_item
-                                            )
-                                            content_parts.append(text_content.text)
-                                        elif content_item.type == "image":
-                                            image_content = cast(
-                                                types.ImageContent, content_item
-                                            )
-                                            content_parts.append(
-                                                f"[image: {image_content.mimeType}]"
-                                            )
-                                        elif content_item.type == "resource":
-                                            resource_content = cast(
-                                                types.EmbeddedResource, content_item
-                                            )
-                                            content_parts.append(
-                                                f"[resource: {resource_content.resource}]"
-                                            )
-                                        else:
-                                            content_parts.append(str(content_item))
-                                    else:
-                                        content_parts.append(str(content_item))
-
-                                result_text = "\n".join(content_parts)
+                                # Binary payloads stay out of the prompt, see BlobStore
+                                result_text = render_tool_content(
+                                    call_result.content, blob_store
+                                )
 
                                 if (
                                     hasattr(call_result, "isError")
@@ -153,6 +262,14 @@ async def get_mcp_tools(mcp_client: mcp_mqtt.MqttTransportClient) -> List[BaseTo
                             else:
                                 return str(call_result)
 
+                        except ArgumentError as e:
+                            error_msg = f"invalid arguments for {tool_name}: {e}"
+                            logger.error(error_msg)
+                            return error_msg
+                        except TimeoutError:
+                            error_msg = f"call {tool_name} timed out"
+                            logger.error(error_msg)
+                            return error_msg
                         except Exception as e:
                             error_msg = f"call {tool_name} error: {e}"
                             logger.error(error_msg)
@@ -160,14 +277,12 @@ async def get_mcp_tools(mcp_client: mcp_mqtt.MqttTransportClient) -> List[BaseTo
 
                     return mcp_tool_wrapper
 
-                wrapper_func = create_mcp_tool_wrapper(
-                    mcp_client, "ESP32 Demo Server", tool.name
-                )
-
                 try:
+                    # Cached by schema content, reloading the catalog reuses it
                     input_schema = getattr(tool, "inputSchema", {}) or {}
-                    fn_schema = build_fn_schema_from_input_schema(
-                        tool.name, input_schema
+                    fn_schema = compile_schema(tool.name, input_schema)
+                    wrapper_func = create_mcp_tool_wrapper(
+                        mcp_client, MCP_SERVER_NAME, tool.name, fn_schema
                     )
                     llamaindex_tool = FunctionTool.from_defaults(
                         fn=wrapper_func,
@@ -197,51 +312,93 @@ def process_tool_output(response_text):
     return None
 
 
-def explain_photo(image_url: str, question: str) -> str:
-    """Explain the photo by the question. Used when users ask a question about the photo. The image_url is the url of the image."""
+async def explain_photo(image_url: str, question: str) -> str:
+    """Explain the photo by the question. Used when users ask a question about the photo. The image_url is the url of the image or its blob:// handle from a tool result."""
+    try:
+        with anyio.fail_after(tool_call_budget()):
+            return await vision_service.explain(image_url, question)
+    except TimeoutError:
+        error_msg = "call explain_photo timed out"
+        logger.error(error_msg)
+        return error_msg
+    except Exception as e:
+        error_msg = f"call explain_photo error: {e}"
+        logger.error(error_msg)
+        return error_msg
 
-    request_body = {
-        "role": "user",
-        "content": [
-            {
-                "type": "image_url",
-                "image_url": {"url": image_url},
-            },
-            {"type": "text", "text": question},
-        ],
-    }
 
-    client = OpenAI(
-        api_key="sk-******",
-        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+def create_explain_photo_tool() -> FunctionTool:
+    # The schema is inferred from the coroutine's signature
+    return FunctionTool.from_defaults(
+        name="explain_photo",
+        description="Explain the photo by the question. Used when users ask a question about the photo. The image_url is the url of the image or its blob:// handle from a tool result.",
+        async_fn=explain_photo,
     )
-    completion = client.chat.completions.create(
-        model="qwen-vl-plus",
-        messages=[request_body],
-    )
-    # 提取第一个 choice 的 message.content 字段
-    content = ""
-    if completion.choices and hasattr(completion.choices[0], "message"):
-        content = completion.choices[0].message.content
-    return content
-
-
-def add_explain_photo_tool(self):
-    self.tools.append(
-        FunctionTool.from_defaults(
-            fn=explain_photo,
-            name="explain_photo",
-            description="Explain the photo by the question. Used when users ask a question about the photo. The image_url is the url of the image.",
-            async_fn=explain_photo,
-            fn_schema={
-                "type": "object",
-                "properties": {
-                    "image_url": {"type": "string"},
-                    "question": {"type": "string"},
-                },
-                "required": ["image_url", "question"],
-            },
-        )
+
+
+def create_look_and_explain_tool(self) -> FunctionTool:
+    async def look_and_explain(question: str) -> str:
+        """Take a photo with the camera and answer the user's question about it. Used for every visual question, e.g. how the user looks or what is in front of the camera. Returns the description of the photo."""
+        try:
+            with anyio.fail_after(tool_call_budget()):
+                result = await capture_photo(
+                    self.mcp_client, {}, self.burst_frames, self.photo_prefetcher
+                )
+            if result is False:
+                return "call take_photo failed"
+            if getattr(result, "isError", False):
+                return f"take_photo return error: {result.content}"
+
+            # The photo goes straight to the vision model, never through the LLM
+            image = await _result_image_bytes(result)
+            if image is None:
+                return "take_photo returned no image"
+            return await vision_service.explain_image(image, question)
+        except TimeoutError:
+            error_msg = "call look_and_explain timed out"
+            logger.error(error_msg)
+            return error_msg
+        except Exception as e:
+            error_msg = f"call look_and_explain error: {e}"
+            logger.error(error_msg)
+            return error_msg
+
+    return FunctionTool.from_defaults(async_fn=look_and_explain)
+
+
+class CompactToolMetadata(ToolMetadata):
+    """Tool metadata sent with a minified schema, see minify_tool"""
+
+    def to_openai_tool(self, skip_length_check: bool = False) -> Dict[str, Any]:
+        # Built once; the LLM asks for it on every request
+        tool = self.__dict__.get("_openai_tool")
+        if tool is None:
+            tool = self.__dict__["_openai_tool"] = minify_tool(
+                super().to_openai_tool(skip_length_check)
+            )
+        # The LLM adds strict and additionalProperties to the dicts it gets
+        function = dict(tool["function"])
+        if "parameters" in function:
+            function["parameters"] = dict(function["parameters"])
+        return {**tool, "function": function}
+
+
+def compact_tool(tool: BaseTool) -> BaseTool:
+    """The same tool sent with a minified schema; other tool types are kept"""
+    if not isinstance(tool, FunctionTool) or isinstance(
+        tool.metadata, CompactToolMetadata
+    ):
+        return tool
+    metadata = tool.metadata
+    return FunctionTool(
+        fn=tool.fn,
+        async_fn=tool.async_fn,
+        metadata=CompactToolMetadata(
+            description=metadata.description,
+            name=metadata.name,
+            fn_schema=metadata.fn_schema,
+            return_direct=metadata.return_direct,
+        ),
     )
 
 
@@ -259,6 +416,32 @@ def get_first_text_from_tool_output(tool_output: ToolOutput) -> str:
     return ""
 
 
+SYSTEM_PROMPT = """
+                在这个对话中，你将扮演一个情感助手。
+                {vision}
+                根据我提供的问题，生成一个富有温度的回应。注意少于 50 个字符。
+                """
+
+# Vision instruction when look_and_explain is loaded (the device has take_photo)
+LOOK_AND_EXPLAIN_INSTRUCTION = """你有视觉能力，当你被问 “你看看我今天打扮得怎么样”、“你看看我这件衣服是什么牌子的” 等视觉相关问题时，直接调用 "look_and_explain" 这个工具，
+                把用户的问题作为参数传给它，它会拍一张照片并针对此照片做出评价，将评价返回给你。不要再分别调用 "take_photo" 和 "explain_photo"。"""
+
+# Vision instruction otherwise
+TAKE_PHOTO_INSTRUCTION = """你有视觉能力，当你被问 “你看看我今天打扮得怎么样”、“你看看我这件衣服是什么牌子的” 等视觉相关问题时，你可以先调用 "take_photo" 这个工具得到一张图片，
+                然后将获得的图片和用户的问题作为参数传给 "explain_photo" 这个工具，针对此照片做出评价，并将评价返回给你。"""
+
+
+@dataclass
+class ConversationSession:
+    """State of one conversation (one device); the agent's tools and LLMs are shared"""
+
+    session_id: str
+    # Cleaned user/assistant messages of past turns, oldest dropped first
+    history: deque
+    # time.monotonic() of the last turn, for the idle timeout
+    last_used: float = 0.0
+
+
 class FuncCallEvent(Event):
     tool_name: str
     tool_kwargs: dict[str, Any]
@@ -270,7 +453,21 @@ class MessageEvent(Event):
 
 
 class ConversationalAgent(Workflow):
-    def __init__(self, mcp_client: Optional[mcp_mqtt.MqttTransportClient] = None):
+    def __init__(
+        self,
+        mcp_client: Optional[mcp_mqtt.MqttTransportClient] = None,
+        router: Optional[ModelRouter] = None,
+        first_speech_timeout: Optional[float] = 3.0,
+        turn_timeout: Optional[float] = 30.0,
+        timeout_reply: str = TIMEOUT_REPLY,
+        burst_frames: int = 1,
+        photo_prefetcher: Optional[PhotoPrefetcher] = None,
+        min_sentence_chars: int = 4,
+        max_sentence_chars: int = 50,
+        tool_selector: Optional[ToolSelector] = None,
+        max_sessions: int = 1024,
+        session_ttl: Optional[float] = 3600.0,
+    ):
         # Initialize base Workflow to set up dispatcher and internal state
         super().__init__()
         # self.llm = SiliconFlow(
@@ -281,106 +478,233 @@ class ConversationalAgent(Workflow):
         #     timeout=180,
         # )
 
-        self.llm = OpenAILike(
-            model="qwen-plus",
-            api_key="sk-******",
-            api_base="https://dashscope.aliyuncs.com/compatible-mode/v1",
-            is_chat_model=True,
-            is_function_calling_model=True,
-            temperature=0,
-            max_tokens=6000,
-            timeout=600,  # 整体超时时间
-            stream_timeout=300,  # 流式响应单项超时
-        )
-        Settings.llm = self.llm
+        # Per-turn time budget shared by LLM requests and tool calls, see TurnDeadline
+        self.first_speech_timeout = first_speech_timeout
+        self.turn_timeout = turn_timeout
+        self.timeout_reply = timeout_reply
+
+        # take_photo takes this many frames and keeps the sharpest, 1 disables it
+        self.burst_frames = burst_frames
+
+        # Optional speculative take_photo for visual questions, run alongside the LLM
+        self.photo_prefetcher = photo_prefetcher
+
+        # Streamed replies are written as one MessageEvent per sentence, see
+        # SentenceSegmenter
+        self.min_sentence_chars = min_sentence_chars
+        self.max_sentence_chars = max_sentence_chars
+
+        # Shared read-only by every session; the global Settings.llm is left alone
+        self.llm = self._create_llm("qwen-plus")
+
+        # Optional model tiering: small talk goes to a faster model
+        self.router = router
+        self._llms = {self.llm.model: self.llm}
 
         self.mcp_client = mcp_client
+        # Replaced as a whole once loaded, never mutated while runs may read it
         self.tools = []
+        # OpenAI-format specs of self.tools, indexed by the tool selector
+        self._tool_specs = []
+        self._tools_lock = anyio.Lock()
 
-        # self.agent = AgentRunner.from_llm(llm=self.llm, tools=self.tools, verbose=True)
+        # Optional per-turn tool subset: only tools relevant to the utterance
+        # and the pinned ones are sent
+        self.tool_selector = tool_selector
 
-        self.mcp_tools_loaded = False
+        # Bumped whenever self.tools is replaced
+        self._tools_version = 0
 
-        self.conversation_history = []
+        # Agent workflows by LLM model and tool subset, valid for one tools version
+        self._workflows: "OrderedDict[tuple, AgentWorkflow]" = OrderedDict()
+        self._workflows_version = None
+        self.max_workflows = 32
 
-        self.max_history_length = 20
+        # self.agent = AgentRunner.from_llm(llm=self.llm, tools=self.tools, verbose=True)
 
-        self.system_prompt = """
-                在这个对话中，你将扮演一个情感助手。
-                你有视觉能力，当你被问 “你看看我今天打扮得怎么样”、“你看看我这件衣服是什么牌子的” 等视觉相关问题时，你可以先调用 "take_photo" 这个工具得到一张图片，
-                然后将获得的图片和用户的问题作为参数传给 "explain_photo" 这个工具，针对此照片做出评价，并将评价返回给你。
-                根据我提供的问题，生成一个富有温度的回应。注意少于 50 个字符。
-                """
+        # Reset when the MCP server reconnects, disconnects or changes its tools
+        self.mcp_tools_loaded = False
+        _agents.add(self)
 
-    def _build_chat_messages(self, new_message: str) -> list:
-        """Build structured chat message array"""
-        messages = []
-
-        # Add system prompt
-        messages.append(
-            ChatMessage(
-                role=MessageRole.SYSTEM,
-                content=self.system_prompt,
-                additional_kwargs={},
-            )
+        # Conversation state by session id, least recently used first; everything
+        # else is shared by the runs. Sessions idle for session_ttl seconds or
+        # beyond max_sessions are dropped and start afresh
+        self.max_history_length = 20
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._system_message = None
+
+        self.system_prompt = self._build_system_prompt(self.tools)
+
+    @staticmethod
+    def _build_system_prompt(tools: Sequence[BaseTool]) -> str:
+        """System prompt whose vision instruction names the tools actually loaded"""
+        if any(tool.metadata.name == "look_and_explain" for tool in tools):
+            vision = LOOK_AND_EXPLAIN_INSTRUCTION
+        else:
+            vision = TAKE_PHOTO_INSTRUCTION
+        return SYSTEM_PROMPT.format(vision=vision)
+
+    def _create_llm(self, model: str) -> OpenAILike:
+        # The turn deadline cancels slow requests; client timeouts are only a backstop
+        timeout = self.turn_timeout or 600
+        return OpenAILike(
+            model=model,
+            api_key="sk-******",
+            api_base="https://dashscope.aliyuncs.com/compatible-mode/v1",
+            is_chat_model=True,
+            is_function_calling_model=True,
+            temperature=0,
+            max_tokens=6000,
+            timeout=timeout,  # 整体超时时间
+            stream_timeout=timeout,  # 流式响应单项超时
         )
 
-        # Add conversation history (keep recent N rounds of conversation)
-        recent_history = (
-            self.conversation_history[-self.max_history_length :]
-            if len(self.conversation_history) > self.max_history_length
-            else self.conversation_history
+    def _llm_for(self, model: str) -> OpenAILike:
+        """Return the shared LLM client of a model tier, creating it on first use"""
+        llm = self._llms.get(model)
+        if llm is None:
+            llm = self._llms[model] = self._create_llm(model)
+        return llm
+
+    def _get_workflow(
+        self, llm: OpenAILike, tools: Optional[Sequence[BaseTool]] = None
+    ) -> AgentWorkflow:
+        """Return the cached agent workflow of ``llm`` for ``tools``, all by default"""
+        if self._tools_version != self._workflows_version:
+            self._workflows.clear()
+            self._workflows_version = self._tools_version
+
+        tools = self.tools if tools is None else tools
+        key = (llm.model, tuple(tool.metadata.name for tool in tools))
+        workflow = self._workflows.get(key)
+        if workflow is not None:
+            self._workflows.move_to_end(key)
+            return workflow
+
+        logger.debug(f"build agent workflow: {llm.model}, {len(tools)} tools")
+        workflow = self._workflows[key] = AgentWorkflow.from_tools_or_functions(
+            tools_or_functions=list(tools),
+            llm=llm,
+            system_prompt=self.system_prompt,
+            verbose=False,
+            timeout=self.turn_timeout,
         )
-
-        # Clean history messages, completely remove tool_calls field and filter empty messages
-        for i, msg in enumerate(recent_history):
-            # Ensure content is valid (not None and not empty string)
-            content = msg.content or ""
-
-            if not content.strip():  # Skip empty messages
-                continue
-
-            # Use model_construct to create cleanest messages
-            clean_msg = ChatMessage.model_construct(
-                role=msg.role,
-                content=content,
-                additional_kwargs={},
-                blocks=[],  # Ensure no extra block data
+        if len(self._workflows) > self.max_workflows:
+            self._workflows.popitem(last=False)
+        return workflow
+
+    def get_session(self, session_id: str) -> ConversationSession:
+        """Return the state of a conversation, creating it on first use"""
+        now = time.monotonic()
+        self._expire_sessions(now)
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = ConversationSession(
+                session_id, deque(maxlen=self.max_history_length)
             )
-            messages.append(clean_msg)
-
-        # Add current user message
-        messages.append(
-            ChatMessage(
-                role=MessageRole.USER, content=new_message, additional_kwargs={}
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(session_id)
+        session.last_used = now
+        return session
+
+    def _expire_sessions(self, now: float):
+        if self.session_ttl is None:
+            return
+        # Least recently used first, so only the idle ones at the front are checked
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if now - session.last_used <= self.session_ttl:
+                break
+            self.sessions.popitem(last=False)
+
+    def _build_chat_messages(
+        self, new_message: str, history: Sequence[ChatMessage] = ()
+    ) -> list:
+        """Build structured chat message array"""
+        # History messages are cleaned once when recorded, see _remember
+        if (
+            self._system_message is None
+            or self._system_message.content != self.system_prompt
+        ):
+            self._system_message = self._clean_message(
+                MessageRole.SYSTEM, self.system_prompt
             )
+        messages = [self._system_message, *history]
+        if new_message and new_message.strip():
+            messages.append(
+                ChatMessage(
+                    role=MessageRole.USER, content=new_message, additional_kwargs={}
+                )
+            )
+        return messages
+
+    @staticmethod
+    def _clean_message(role: MessageRole, content: str) -> ChatMessage:
+        # A single text block and no tool_calls; model_construct skips validation,
+        # so the content has to be given as the block (content= would be dropped)
+        return ChatMessage.model_construct(
+            role=role,
+            additional_kwargs={},
+            blocks=[TextBlock(text=content)],
         )
 
-        # Final cleanup: ensure all messages have valid content
-        final_messages = []
-        for msg in messages:
-            # Check if content is valid
-            content = msg.content
-            if content is None or not str(content).strip():
-                continue  # Skip invalid messages
-            else:
-                # Add messages with valid content directly
-                final_messages.append(msg)
+    def _remember(
+        self, session: ConversationSession, role: MessageRole, content: Optional[str]
+    ):
+        """Record a turn in the session history, skipping empty messages"""
+        if content and content.strip():
+            session.history.append(self._clean_message(role, content))
 
-        return final_messages
+    def invalidate_tools(self):
+        """Reload the MCP tools before the next turn"""
+        self.mcp_tools_loaded = False
+
+    def _set_tools(self, tools: Sequence[BaseTool]):
+        """Replace the tools as a whole; runs in flight keep the old list"""
+        # Indexed once for the selector, which counts the tokens saved
+        # against the schemas as they were; they are sent minified
+        self._tool_specs = [
+            tool.metadata.to_openai_tool(skip_length_check=True) for tool in tools
+        ]
+        self.tools = [compact_tool(tool) for tool in tools]
+        # Cached workflows are keyed on the version, the prompt changes with it
+        self.system_prompt = self._build_system_prompt(tools)
+        self._tools_version += 1
 
     async def load_mcp_tools(self):
-        if not self.mcp_tools_loaded and self.mcp_client:
+        if self.mcp_tools_loaded or not self.mcp_client:
+            return
+        # Concurrent first turns load the tools once
+        async with self._tools_lock:
+            if self.mcp_tools_loaded:
+                return
             try:
-                mcp_tools = await get_mcp_tools(self.mcp_client)
+                mcp_tools = await get_mcp_tools(
+                    self.mcp_client,
+                    burst_frames=self.burst_frames,
+                    prefetcher=self.photo_prefetcher,
+                )
                 if mcp_tools:
-                    self.tools.extend(mcp_tools)
-                    add_explain_photo_tool(self)
+                    # Built afresh on every (re)load, never on top of the old list
+                    tools = [*mcp_tools, create_explain_photo_tool()]
+                    if any(tool.metadata.name == "take_photo" for tool in mcp_tools):
+                        tools.append(create_look_and_explain_tool(self))
                     # self.agent = AgentRunner.from_llm(
                     #     llm=self.llm, tools=self.tools, verbose=True
                     # )
+                    self._set_tools(tools)
                     logger.info(f"load {len(mcp_tools)} tools")
                     self.mcp_tools_loaded = True
+                    # Also reload on tools/list_changed when the client was
+                    # created without this module's on_mcp_connect
+                    watch_tool_list_changed(self.mcp_client, MCP_SERVER_NAME)
+                elif self.tools:
+                    # The server is gone: stop offering its tools, retry next turn
+                    self._set_tools([])
             except Exception as e:
                 logger.error(f"load tool error: {e}")
 
@@ -423,42 +747,142 @@ class ConversationalAgent(Workflow):
         )
         ctx.write_event_to_stream(func_call_event)
 
+    def _should_prefetch_photo(self, user_input: str) -> bool:
+        return (
+            self.photo_prefetcher is not None
+            and self.photo_prefetcher.matches(user_input)
+            and any(tool.metadata.name == "take_photo" for tool in self.tools)
+        )
+
     @step
     async def chat(self, ctx: Context, ev: StartEvent) -> StopEvent:
+        # run(user_input=..., session_id=...); the session defaults to the device
+        session = self.get_session(ev.get("session_id") or current_device.get())
+        # The workflow's tool tasks copy this context and key photos by device
+        current_device.set(session.session_id)
+        deadline = TurnDeadline(self.first_speech_timeout, self.turn_timeout)
         try:
-            if not self.mcp_tools_loaded:
-                await self.load_mcp_tools()
-
-            query_info = AgentWorkflow.from_tools_or_functions(
-                tools_or_functions=self.tools,
-                llm=self.llm,
-                system_prompt=self.system_prompt,
-                verbose=False,
-                timeout=180,
+            with deadline.scope():
+                await self._run_turn(ctx, ev, session, deadline)
+            if deadline.expired:
+                logger.warning(f"turn timed out: {ev.user_input}")
+                if not deadline.spoke:
+                    ctx.write_event_to_stream(MessageEvent(message=self.timeout_reply))
+                    self._remember(session, MessageRole.ASSISTANT, self.timeout_reply)
+            return StopEvent()
+
+        except Exception as e:
+            error_msg = f"error: {e}"
+            logger.error(error_msg)
+            return StopEvent()
+
+    async def _run_turn(
+        self,
+        ctx: Context,
+        ev: StartEvent,
+        session: ConversationSession,
+        deadline: TurnDeadline,
+    ):
+        """Run one turn of the agent workflow under the turn deadline"""
+        if not self.mcp_tools_loaded:
+            await self.load_mcp_tools()
+
+        llm = self.llm
+        route = None
+        if self.router is not None:
+            route = self.router.route(
+                ev.user_input,
+                [
+                    f"{tool.metadata.name} {tool.metadata.description}"
+                    for tool in self.tools
+                ],
             )
+            llm = self._llm_for(route.model)
+
+        tools = self.tools
+        if self.tool_selector is not None and tools:
+            selection = self.tool_selector.select(ev.user_input, self._tool_specs)
+            tools = [tools[i] for i in selection.indices]
+        query_info = self._get_workflow(llm, tools)
+
+        message = self._build_chat_messages(ev.user_input, session.history)
+        self._remember(session, MessageRole.USER, ev.user_input)
+        started = anyio.current_time()
+        first_token_at = None
+        async with anyio.create_task_group() as tg:
+            if self._should_prefetch_photo(ev.user_input):
+                # Take the photo while the LLM decides to ask for it
+                tg.start_soon(
+                    self.photo_prefetcher.prefetch,
+                    functools.partial(
+                        capture_photo, self.mcp_client, {}, self.burst_frames
+                    ),
+                )
 
-            message = self._build_chat_messages(ev.user_input)
+            # The workflow copies the current context, so its tasks see the deadline
             handler = query_info.run(chat_history=message)
 
-            output = None
-            async for event in handler.stream_events():
-                if isinstance(event, AgentOutput):
-                    output = event.response
-                    response = process_tool_output(output)
-                    logger.info(f"Agent response: {response}")
-                    ctx.write_event_to_stream(MessageEvent(message=response))
-                elif isinstance(event, ToolCallResult):
-                    text = get_first_text_from_tool_output(event.tool_output)
-                    self._emit_func_call_event(
-                        ctx, event.tool_name, event.tool_kwargs, text
-                    )
+            segmenter = SentenceSegmenter(
+                self.min_sentence_chars, self.max_sentence_chars
+            )
+            # Sentences of the current agent step already written to the stream
+            spoken = []
+            streamed = False
 
-            return StopEvent
+            def say(sentence):
+                deadline.mark_spoke()
+                spoken.append(sentence)
+                ctx.write_event_to_stream(MessageEvent(message=sentence))
 
-        except Exception as e:
-            error_msg = f"error: {e}"
-            logger.error(error_msg)
-            return StopEvent
+            output = None
+            try:
+                async for event in handler.stream_events():
+                    if first_token_at is None and isinstance(
+                        event, (AgentStream, AgentOutput)
+                    ):
+                        first_token_at = anyio.current_time()
+                    if isinstance(event, AgentStream):
+                        streamed = streamed or bool(event.delta)
+                        for sentence in segmenter.feed(event.delta):
+                            say(sentence)
+                    elif isinstance(event, AgentOutput):
+                        if event.tool_calls:
+                            # Running tools is not charged to the first speech
+                            deadline.mark_tool_call()
+                        output = event.response
+                        response = process_tool_output(output)
+                        logger.info(f"Agent response: {response}")
+                        if not streamed and response:
+                            # Not streamed, e.g. a non-streaming LLM
+                            for sentence in segmenter.feed(response):
+                                say(sentence)
+                        rest = segmenter.flush()
+                        if rest:
+                            say(rest)
+                        self._remember(session, MessageRole.ASSISTANT, response)
+                        spoken.clear()
+                        streamed = False
+                    elif isinstance(event, ToolCallResult):
+                        text = get_first_text_from_tool_output(event.tool_output)
+                        self._emit_func_call_event(
+                            ctx, event.tool_name, event.tool_kwargs, text
+                        )
+            except anyio.get_cancelled_exc_class():
+                # The agent runs in its own tasks, stop them when the budget runs out
+                with anyio.CancelScope(shield=True):
+                    await handler.cancel_run()
+                self._remember(session, MessageRole.ASSISTANT, "".join(spoken))
+                raise
+
+            # An unfinished prefetch was not needed in this turn
+            tg.cancel_scope.cancel()
+
+        if route is not None:
+            self.router.record(
+                route.turn_class,
+                first_token_at - started if first_token_at else None,
+                anyio.current_time() - started,
+            )
 
 
 async def main():
@@ -476,7 +900,11 @@ async def main():
             await mcp_client.start()
             await anyio.sleep(3)
 
-            agent = ConversationalAgent(mcp_client)
+            agent = ConversationalAgent(
+                mcp_client,
+                photo_prefetcher=PhotoPrefetcher(),
+                tool_selector=ToolSelector(pinned=VISION_TOOL_NAMES),
+            )
             if not agent.mcp_tools_loaded:
                 await agent.load_mcp_tools()
 
@@ -501,6 +929,13 @@ async def main():
                             print(f"- {tool_name}: {tool_desc}")
                         continue
 
+                    if user_input.lower() == "stats":
+                        print(f"vision: {vision_service.stats()}")
+                        print(f"blobs: {blob_store.stats()}")
+                        print(f"photo prefetch: {agent.photo_prefetcher.stats()}")
+                        print(f"tool selector: {agent.tool_selector.stats()}")
+                        continue
+
                     if not user_input:
                         continue
 
@@ -1,18 +1,41 @@
 from ast import Dict, List
 import asyncio
+from dataclasses import dataclass
 from enum import Enum
 import json
 import logging
+import math
 import os
+import sys
 from typing import Any, Optional
 import uuid
 import anyio
 import mcp.client.mqtt as mcp_mqtt
 from mcp.shared.mqtt import configure_logging
-from openai import OpenAI
+from openai import NOT_GIVEN, AsyncOpenAI
 from openai.types import CompletionUsage
-import re
+import weakref
 from tool_description import Message, ToolDefinition
+from util import (
+    AllEndpointsFailed,
+    ArgumentError,
+    BlobStore,
+    DialogueWindow,
+    HedgedLLM,
+    LLMEndpoint,
+    ModelRouter,
+    ResponseCache,
+    RouteDecision,
+    StreamingToolCallParser,
+    TIMEOUT_REPLY,
+    ToolSelection,
+    ToolSelector,
+    TurnDeadline,
+    compile_schema,
+    render_tool_content,
+    tool_call_budget,
+    validate_arguments,
+)
 from typing import cast
 import mcp.types as types
 
@@ -27,6 +50,8 @@ async def on_mcp_server_discovered(client, server_name):
 
 
 async def on_mcp_connect(client, server_name, connect_result):
+    watch_tool_list_changed(client, server_name)
+    invalidate_tool_catalogs(client, server_name)
     capabilities = client.get_session(server_name).server_info.capabilities
     logger.info(f"Capabilities of {server_name}: {capabilities}")
     if capabilities.prompts:
@@ -45,6 +70,7 @@ async def on_mcp_connect(client, server_name, connect_result):
 
 async def on_mcp_disconnect(client, server_name):
     logger.info(f"Disconnected from {server_name}")
+    invalidate_tool_catalogs(client, server_name)
 
 
 SERVER_NAME = "ESP32 Demo Server"
@@ -55,6 +81,7 @@ from typing import Dict  # <-- Add this import at the top of your file if not pr
 
 async def get_mcp_tools(
     mcp_client: mcp_mqtt.MqttTransportClient,
+    server_name: str = SERVER_NAME,
 ) -> list[dict]:
     """
     获取 MCP 工具列表，并将其转换为可 JSON 序列化的字典列表。
@@ -63,7 +90,7 @@ async def get_mcp_tools(
     tool_list: list[dict] = []
 
     try:
-        tools_result = await mcp_client.list_tools(SERVER_NAME)
+        tools_result = await mcp_client.list_tools(server_name)
 
         if tools_result is False:
             return tool_list
@@ -75,8 +102,11 @@ async def get_mcp_tools(
             tool_def = {
                 "type": "function",
                 "function": {
-                    "name": tool.name,
-                    "description": tool.description,
+                    # 多个会话共享同一批工具的名称和描述字符串
+                    "name": sys.intern(tool.name),
+                    "description": (
+                        sys.intern(tool.description) if tool.description else None
+                    ),
                     "parameters": getattr(tool, "inputSchema", None),
                 },
             }
@@ -88,13 +118,112 @@ async def get_mcp_tools(
     return tool_list
 
 
-def extract_json_from_string(input_string):
-    """提取字符串中的 JSON 部分"""
-    pattern = r"(\{.*\})"
-    match = re.search(pattern, input_string, re.DOTALL)  # 添加 re.DOTALL
-    if match:
-        return match.group(1)  # 返回提取的 JSON 字符串
-    return None
+# 所有存活的工具目录缓存，用于在 MCP 回调中统一失效
+_tool_catalogs: "weakref.WeakSet[ToolCatalog]" = weakref.WeakSet()
+
+
+class ToolCatalog:
+    """
+    MCP 工具目录缓存。
+
+    首次访问时通过 list_tools 拉取工具列表并缓存为 OpenAI tools 格式，之后每轮对话
+    直接从内存返回；收到 notifications/tools/list_changed 或 MCP 断开时失效，
+    下一次访问再重新拉取。
+    """
+
+    def __init__(
+        self,
+        mcp_client: mcp_mqtt.MqttTransportClient,
+        server_name: str = SERVER_NAME,
+    ):
+        self.mcp_client = mcp_client
+        self.server_name = server_name
+        # 每次重新拉取后递增，供依赖工具列表的缓存判断是否过期
+        self.version = 0
+        self._tools: Optional[list[dict]] = None
+        # 工具名 -> 参数模型，用于调用前在本地校验参数
+        self._arg_models: dict = {}
+        self._lock = anyio.Lock()
+        _tool_catalogs.add(self)
+
+    @property
+    def loaded(self) -> bool:
+        return self._tools is not None
+
+    @property
+    def tools(self) -> list[dict]:
+        """当前缓存的工具列表，未加载时为空列表"""
+        return self._tools or []
+
+    async def get(self) -> list[dict]:
+        """返回工具列表，缓存失效时才会请求设备"""
+        if self._tools is not None:
+            return self._tools
+
+        async with self._lock:
+            # 等锁期间可能已被其他协程填充
+            if self._tools is None:
+                tools = await get_mcp_tools(self.mcp_client, self.server_name)
+                # 拉取失败时 get_mcp_tools 返回空列表，不缓存，下次重试
+                if tools:
+                    # 按 schema 内容缓存，未变化的工具不会重新生成模型
+                    self._arg_models = {
+                        tool["function"]["name"]: compile_schema(
+                            tool["function"]["name"], tool["function"]["parameters"]
+                        )
+                        for tool in tools
+                    }
+                    self._tools = tools
+                    self.version += 1
+                    logger.info(
+                        f"Tool catalog of {self.server_name} loaded: {len(tools)} tools"
+                    )
+            return self.tools
+
+    def validate(self, name: str, arguments: dict) -> dict:
+        """
+        按工具的 inputSchema 校验并转换参数，不合法时抛出 ArgumentError。
+        不在目录中的工具原样返回，交给设备处理。
+        """
+        model = self._arg_models.get(name)
+        if model is None:
+            return arguments
+        return validate_arguments(model, arguments)
+
+    def invalidate(self):
+        if self._tools is not None:
+            logger.info(f"Tool catalog of {self.server_name} invalidated")
+        self._tools = None
+
+
+def invalidate_tool_catalogs(client, server_name):
+    """使指定 MCP 客户端和服务器对应的所有工具目录缓存失效"""
+    for catalog in list(_tool_catalogs):
+        if catalog.mcp_client is client and catalog.server_name == server_name:
+            catalog.invalidate()
+
+
+def watch_tool_list_changed(client, server_name):
+    """
+    在 MCP 会话上挂载通知处理，收到 notifications/tools/list_changed 时使工具目录失效。
+    其余消息仍交给会话原有的 message handler 处理。
+    """
+    session = client.get_session(server_name)
+    if session is None or getattr(session, "_tool_list_watched", False):
+        return
+
+    original_handler = getattr(session, "_message_handler", None)
+
+    async def message_handler(message):
+        notification = getattr(message, "root", message)
+        if isinstance(notification, types.ToolListChangedNotification):
+            logger.info(f"Tools of {server_name} changed")
+            invalidate_tool_catalogs(client, server_name)
+        if original_handler is not None:
+            await original_handler(message)
+
+    session._message_handler = message_handler
+    session._tool_list_watched = True
 
 
 class Action(Enum):
@@ -116,31 +245,128 @@ class ActionResponse:
         self.response = response  # 直接回复的内容
 
 
+@dataclass
+class TextDelta:
+    """一段新生成的回复文本"""
+
+    text: str
+
+
+@dataclass
+class ToolCallStart:
+    """工具调用参数已完整，开始执行"""
+
+    id: str
+    name: str
+    arguments: str
+
+
+@dataclass
+class ToolCallEnd:
+    """工具调用执行结束"""
+
+    id: str
+    name: str
+    ok: bool
+    elapsed: float  # 执行耗时（秒）
+
+
+@dataclass
+class ToolResult:
+    """工具结果已写入对话"""
+
+    id: str
+    name: str
+    content: Any
+    is_error: bool = False
+
+
+@dataclass
+class Usage:
+    """一次 LLM 请求的 Token 消耗"""
+
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
+
 class ConversationalAgent:
     def __init__(
         self,
         model_name,
-        llm: OpenAI,
+        llm: AsyncOpenAI,
         mcp_client: Optional[mcp_mqtt.MqttTransportClient] = None,
+        max_tool_concurrency: int = 4,
+        max_context_tokens: int = 4000,
+        tokenizer=None,
+        response_cache: Optional[ResponseCache] = None,
+        fallback_endpoints: Optional[list[LLMEndpoint]] = None,
+        first_token_deadline: float = 2.0,
+        router: Optional[ModelRouter] = None,
+        first_speech_timeout: Optional[float] = 3.0,
+        turn_timeout: Optional[float] = 30.0,
+        timeout_reply: str = TIMEOUT_REPLY,
+        blob_store: Optional[BlobStore] = None,
+        tool_selector: Optional[ToolSelector] = None,
     ):
 
         self.llm = llm
 
         self.model_name = model_name
 
+        # 主端点之后依次是备用端点：首 token 超时则对冲请求下一个，请求失败则立即切换
+        self.hedged_llm = HedgedLLM(
+            [LLMEndpoint(llm, model_name), *(fallback_endpoints or [])],
+            first_token_deadline=first_token_deadline,
+        )
+
         self.mcp_client = mcp_client
 
-        self.dialogue: List[Message] = []
+        # 按 token 预算保留对话，超出预算的旧对话由后台任务折叠为摘要
+        self.dialogue = DialogueWindow(
+            max_tokens=max_context_tokens,
+            tokenizer=tokenizer,
+            summarizer=self.summarize_dialogue,
+            message_factory=Message,
+        )
 
         self.logger = logger
 
         self.loop = asyncio.get_event_loop()
 
-        self.tools: List[Dict] = []
+        self.tool_catalog = ToolCatalog(mcp_client) if mcp_client else None
+
+        # 同一轮工具调用的并发上限
+        self.tool_limiter = anyio.CapacityLimiter(max_tool_concurrency)
+
+        # 可选的回复缓存，重复的寒暄类对话直接返回，不请求 LLM
+        self.response_cache = response_cache
+
+        # 可选的模型分级路由，闲聊交给更快的小模型
+        self.router = router
+
+        # 每轮对话的时间预算：LLM 请求、工具调用和后续一轮共用剩余时间，超时则回复兜底话术
+        self.first_speech_timeout = first_speech_timeout
+        self.turn_timeout = turn_timeout
+        self.timeout_reply = timeout_reply
+
+        # 工具返回的图片等二进制内容存入 blob store，对话中只保留 blob:// 引用；
+        # 未设置时只保留类型，不把原始数据写进对话
+        self.blob_store = blob_store
+
+        # 可选的工具筛选：每轮只发送与用户输入相关的工具（及固定工具），schema 精简后发送
+        self.tool_selector = tool_selector
+
+    @property
+    def tools(self) -> list[dict]:
+        return self.tool_catalog.tools if self.tool_catalog else []
+
+    async def get_tools(self) -> list[dict]:
+        """获取工具列表，优先使用缓存"""
+        return await self.tool_catalog.get() if self.tool_catalog else []
 
     async def init(self):
-        tools = await get_mcp_tools(self.mcp_client) if self.mcp_client else []
-        self.tools = tools
+        await self.get_tools()
         self.dialogue.append(
             Message(
                 role="system",
@@ -153,31 +379,62 @@ class ConversationalAgent:
             )
         )
 
-    def call_openai(self, query, functions=None):
+    async def summarize_dialogue(self, summary: str, messages: list) -> str:
+        """将移出窗口的对话与已有摘要合并成新的摘要"""
+        lines = []
+        for msg in messages:
+            if msg.role in ("user", "assistant") and isinstance(msg.content, str):
+                lines.append(f"{msg.role}: {msg.content}")
+            elif msg.role == "tool":
+                lines.append(f"tool: {msg.content}")
+        if not lines:
+            return summary
+
+        prompt = (
+            "请将已有摘要和新的对话内容合并为一段简洁的中文摘要，保留用户偏好和关键事实。\n"
+            f"已有摘要：{summary or '无'}\n"
+            "新的对话：\n" + "\n".join(lines)
+        )
+        completion = await self.llm.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        return completion.choices[0].message.content or summary
+
+    async def call_openai(self, query, functions=None, model=None):
+        """
+        流式请求 LLM，逐块产出 (content, tool_calls, usage)。
+
+        usage 仅在最后一个 Token 统计块中不为 None，其余块的 usage 均为 None。
+
+        基于 AsyncOpenAI 的异步生成器，等待网络数据时会让出事件循环，
+        多个会话和 MCP 的 MQTT 传输可以共用同一个事件循环。
+        配置了备用端点时，由 HedgedLLM 选出最先返回首 token 的流。
+        model 用于覆盖主端点的模型（见 ModelRouter）。
+        query 为 None 时只发送对话中已有的消息。
+        所有端点都失败时抛出 AllEndpointsFailed，由 chat_stream 回复兜底话术。
+        """
         try:
-            # Convert Message objects to dicts before sending to OpenAI
-            def message_to_dict(msg):
-                d = msg.__dict__.copy()
-                # Remove None values for OpenAI compatibility
-                return {k: v for k, v in d.items() if v is not None}
-
-            messages_payload = [message_to_dict(m) for m in self.dialogue]
-            messages_payload.append(
-                message_to_dict(Message(role="user", content=query))
-            )
-            stream = self.llm.chat.completions.create(
-                model=self.model_name,
+            # 历史消息在写入对话时已序列化，前缀保持不变，只需追加本轮的用户消息
+            messages_payload = self.dialogue.payload()
+            if query is not None:
+                messages_payload = messages_payload + [
+                    {"role": "user", "content": query}
+                ]
+            stream = self.hedged_llm.stream(
+                model=model,
                 messages=messages_payload,
-                stream=True,
-                tools=functions,
+                stream_options={"include_usage": True},
+                tools=functions or NOT_GIVEN,
             )
 
-            for chunk in stream:
+            async for chunk in stream:
                 # 检查是否存在有效的choice且content不为空
                 if getattr(chunk, "choices", None):
                     yield (
                         chunk.choices[0].delta.content,
                         chunk.choices[0].delta.tool_calls,
+                        None,
                     )
                 # 存在 CompletionUsage 消息时，生成 Token 消耗 log
                 elif isinstance(getattr(chunk, "usage", None), CompletionUsage):
@@ -187,7 +444,10 @@ class ConversationalAgent:
                         f"输出 {getattr(usage_info, 'completion_tokens', '未知')}，"
                         f"共计 {getattr(usage_info, 'total_tokens', '未知')}"
                     )
+                    yield (None, None, usage_info)
 
+        except AllEndpointsFailed:
+            raise
         except Exception as e:
             logger.error(f"Error in function call streaming: {e}")
 
@@ -212,160 +472,403 @@ class ConversationalAgent:
                         response="无法解析函数参数",
                     )
 
+            # 参数不合法时直接返回错误，不再经 MQTT 发往设备
+            if self.tool_catalog is not None:
+                arguments = self.tool_catalog.validate(function_name, arguments)
+
             self.logger.debug(f"调用函数: {function_name}, 参数: {arguments}")
 
-            # 执行工具调用（需要等待协程完成）
-            result = await self.mcp_client.call_tool(
-                SERVER_NAME, function_name, arguments
-            )
+            # 执行工具调用（需要等待协程完成），最多使用本轮剩余的总时间
+            with anyio.fail_after(tool_call_budget()):
+                result = await self.mcp_client.call_tool(
+                    SERVER_NAME, function_name, arguments
+                )
             return ActionResponse(action=Action.REQLLM, result=result)
 
+        except ArgumentError as e:
+            self.logger.error(f"函数参数错误: {function_call_data.get('name')}: {e}")
+            return ActionResponse(action=Action.ERROR, response=f"参数错误: {e}")
+        except TimeoutError:
+            self.logger.error(f"调用函数超时: {function_call_data.get('name')}")
+            return ActionResponse(action=Action.ERROR, response="工具调用超时")
         except Exception as e:
             self.logger.error(f"处理function call错误: {e}")
             return ActionResponse(action=Action.ERROR, response=str(e))
 
-    async def _handle_function_result(self, result, function_call_data):
-        if result.action == Action.REQLLM:
-            call_result = cast(types.CallToolResult, result.result)
-            text = call_result.content
-            if text is not None and len(text) > 0:
-                function_id = function_call_data["id"]
-                function_name = function_call_data["name"]
-                function_arguments = function_call_data["arguments"]
-                self.dialogue.append(
-                    Message(
-                        role="assistant",
-                        tool_calls=[
-                            {
-                                "id": function_id,
-                                "function": {
-                                    "arguments": (
-                                        "{}"
-                                        if function_arguments == ""
-                                        else function_arguments
-                                    ),
-                                    "name": function_name,
-                                },
-                                "type": "function",
-                                "index": 0,
-                            }
-                        ],
-                    )
-                )
-
-                self.dialogue.append(
-                    Message(
-                        role="tool",
-                        tool_call_id=(
-                            str(uuid.uuid4()) if function_id is None else function_id
+    def _record_function_results(self, results, function_calls) -> list:
+        """将工具调用和结果写入对话，返回对应的 ToolResult 事件"""
+        tool_calls = []
+        tool_messages = []
+        events = []
+        for index, (result, function_call_data) in enumerate(
+            zip(results, function_calls)
+        ):
+            function_id = function_call_data["id"]
+            function_arguments = function_call_data["arguments"]
+            tool_calls.append(
+                {
+                    "id": function_id,
+                    "function": {
+                        "arguments": (
+                            "{}" if function_arguments == "" else function_arguments
                         ),
-                        content=text,
-                    )
+                        "name": function_call_data["name"],
+                    },
+                    "type": "function",
+                    "index": index,
+                }
+            )
+
+            # 每个 tool_call 都需要一条对应 id 的 tool 消息，失败时回填错误信息
+            is_error = True
+            if result is not None and result.action == Action.REQLLM:
+                if result.result is False:
+                    text = f"call {function_call_data['name']} failed"
+                else:
+                    call_result = cast(types.CallToolResult, result.result)
+                    text = render_tool_content(call_result.content, self.blob_store)
+                    is_error = bool(getattr(call_result, "isError", False))
+            else:
+                text = result.response if result is not None else "工具调用失败"
+
+            tool_messages.append(
+                Message(role="tool", tool_call_id=function_id, content=text)
+            )
+            events.append(
+                ToolResult(
+                    id=function_id,
+                    name=function_call_data["name"],
+                    content=text,
+                    is_error=is_error,
                 )
-            res = await self.chat("请根据以上工具调用结果，回复用户")
-            return res
-        else:
-            pass
+            )
 
-    async def chat(self, query) -> str:
+        self.dialogue.append(Message(role="assistant", tool_calls=tool_calls))
+        self.dialogue.extend(tool_messages)
+        return events
+
+    async def chat_stream(self, query):
+        """
+        对话一轮，以异步生成器逐个产出事件：TextDelta、ToolCallStart、ToolCallEnd、
+        ToolResult 和 Usage。调用了工具时，后续一轮的事件会接着产出。
+
+        需要在同一个任务中迭代到结束（或调用 aclose()），中途放弃迭代会取消仍在执行的请求和工具调用，已输出的文本写入对话。
+
+        整轮对话在独立的任务中、以 TurnDeadline 的时间预算执行：开口前最多 first_speech_timeout 秒
+        （开始调用工具后不再受此限制），整轮最多 turn_timeout 秒。预算用完时取消仍在进行的请求和工具调用，尚未开口则回复兜底话术。
+        所有 LLM 端点都失败时同样回复兜底话术，对话中的 user/assistant 仍保持成对。
+        """
+        deadline = TurnDeadline(self.first_speech_timeout, self.turn_timeout)
+        send_events, receive_events = anyio.create_memory_object_stream(math.inf)
+
+        async def produce():
+            # 已输出但还未写入对话的文本
+            spoken = []
+            finished = False
+            try:
+                async with send_events:
+                    with deadline.scope():
+                        try:
+                            async for event in self._chat_turn(query):
+                                if isinstance(event, TextDelta):
+                                    deadline.mark_spoke()
+                                    spoken.append(event.text)
+                                elif isinstance(event, ToolCallStart):
+                                    # 工具执行的时间不计入开口前的预算
+                                    deadline.mark_tool_call()
+                                elif isinstance(event, ToolResult):
+                                    # 工具调用前的文本已随工具调用写入对话
+                                    spoken.clear()
+                                send_events.send_nowait(event)
+                            finished = True
+                        except AllEndpointsFailed as e:
+                            self.logger.error(f"LLM 请求失败: {query}, {e}")
+
+                    if not finished and not spoken:
+                        spoken.append(self.timeout_reply)
+                        send_events.send_nowait(TextDelta(text=self.timeout_reply))
+            finally:
+                # 超时、失败或调用方提前放弃时，把已输出的文本（或兜底话术）写入对话，保持 user/assistant 成对
+                if not finished:
+                    if deadline.expired:
+                        self.logger.warning(f"对话超时: {query}")
+                    reply = "".join(spoken) or self.timeout_reply
+                    self.dialogue.append(Message(role="assistant", content=reply))
+
+        # 取消作用域不能跨越生成器的 yield，事件经内存流转发给调用方
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(produce)
+            async with receive_events:
+                try:
+                    async for event in receive_events:
+                        yield event
+                except GeneratorExit:
+                    # 调用方提前 aclose()：取消本轮后正常退出，不再产出事件
+                    tg.cancel_scope.cancel()
 
-        # Load tools and set to self.tools
-        tools = await get_mcp_tools(self.mcp_client) if self.mcp_client else {}
-        llm_responses = self.call_openai(query, tools)
+    async def _chat_turn(
+        self,
+        query,
+        record_query: bool = True,
+        route: Optional[RouteDecision] = None,
+        selection: Optional[ToolSelection] = None,
+    ):
+        """
+        chat_stream 的一轮，调用了工具时递归执行后续一轮。
+
+        record_query 为 False 时 query 不写入对话（后续一轮的提示语）。
+        配置了 router 时按本轮的分类选择模型，route 用于让后续一轮沿用同一分级。
+        配置了 tool_selector 时按用户输入筛选工具，selection 用于让后续一轮沿用同一批工具。
+        """
+
+        # 先写入用户消息，超时中断时对话仍保持 user/assistant 成对
+        if record_query:
+            self.dialogue.append(Message(role="user", content=query))
+
+        # 工具列表来自缓存，仅在失效后才会重新请求设备
+        tools = await self.get_tools()
+
+        cache_key = None
+        if self.response_cache is not None and record_query:
+            cache_key = self.response_cache.make_key(
+                self.dialogue.system.content if self.dialogue.system else "",
+                self.tool_catalog.version if self.tool_catalog else 0,
+                # 最近几轮的 user/assistant 消息，跳过工具调用，不含刚写入的用户消息
+                self.dialogue.recent_messages(
+                    self.response_cache.context_turns + 1, roles=("user", "assistant")
+                )[:-1],
+                query,
+            )
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                self.dialogue.append(Message(role="assistant", content=cached))
+                self.tts_MessageText = cached
+                yield TextDelta(text=cached)
+                return
+
+        if route is None and self.router is not None:
+            route = self.router.route(
+                query,
+                [
+                    f"{tool['function']['name']} {tool['function'].get('description') or ''}"
+                    for tool in tools
+                ],
+            )
+        sent_tools = tools
+        if self.tool_selector is not None and tools:
+            if selection is None:
+                selection = self.tool_selector.select(query, tools)
+            sent_tools = selection.tools
+        llm_responses = self.call_openai(
+            None if record_query else query,
+            sent_tools or None,
+            route.model if route else None,
+        )
+        started = anyio.current_time()
+        first_token_at = None
 
         # 处理流式响应
         response_message = []
-        tool_call_flag = False
-        function_name = None
-        function_id = None
-        function_arguments = ""
-        content_arguments = ""
-
-        for response in llm_responses:
+        # 增量解析原生 tool_calls 和文本中的 <tool_call>，参数完整即可执行
+        parser = StreamingToolCallParser()
+        function_calls: list[dict] = []
+        results: list[Optional[ActionResponse]] = []
+        # 工具执行完成的事件由子任务写入，在流式输出的间隙转发给调用方
+        send_events, receive_events = anyio.create_memory_object_stream(math.inf)
+
+        async def run(index, function_call_data):
+            async with self.tool_limiter:
+                started = anyio.current_time()
+                result = await self.handle_llm_function_call(function_call_data)
+            results[index] = result
+            send_events.send_nowait(
+                ToolCallEnd(
+                    id=function_call_data["id"],
+                    name=function_call_data["name"],
+                    ok=result is not None and result.action == Action.REQLLM,
+                    elapsed=anyio.current_time() - started,
+                )
+            )
 
-            content, tools_call = response
+        def dispatch(calls) -> list:
+            events = []
+            for function_call_data in calls:
+                if function_call_data["id"] is None:
+                    function_call_data["id"] = str(uuid.uuid4().hex)
+                self.logger.debug(
+                    f"function_name={function_call_data['name']}, "
+                    f"function_id={function_call_data['id']}, "
+                    f"function_arguments={function_call_data['arguments']}"
+                )
+                function_calls.append(function_call_data)
+                results.append(None)
+                tg.start_soon(run, len(function_calls) - 1, function_call_data)
+                events.append(
+                    ToolCallStart(
+                        id=function_call_data["id"],
+                        name=function_call_data["name"],
+                        arguments=function_call_data["arguments"],
+                    )
+                )
+            return events
 
-            if "content" in response:
-                content = response["content"]
-                tools_call = None
+        def finished_events() -> list:
+            events = []
+            while True:
+                try:
+                    events.append(receive_events.receive_nowait())
+                except anyio.WouldBlock:
+                    return events
+
+        # 工具调用在流式生成过程中即开始执行，退出任务组时等待全部完成
+        ended = 0
+        failure = None
+        async with anyio.create_task_group() as tg:
+            try:
+                async for content, tools_call, usage in llm_responses:
+                    events = []
+
+                    if content is not None and len(content) > 0:
+                        text, calls = parser.feed_content(content)
+                        if text:
+                            response_message.append(text)
+                            events.append(TextDelta(text=text))
+                        events.extend(dispatch(calls))
+
+                    if tools_call is not None and len(tools_call) > 0:
+                        events.extend(dispatch(parser.feed_tool_calls(tools_call)))
+
+                    if usage is not None:
+                        events.append(
+                            Usage(
+                                prompt_tokens=usage.prompt_tokens,
+                                completion_tokens=usage.completion_tokens,
+                                total_tokens=usage.total_tokens,
+                            )
+                        )
 
-            if content is not None and len(content) > 0:
-                content_arguments += content
+                    if first_token_at is None and events:
+                        first_token_at = anyio.current_time()
+
+                    events.extend(finished_events())
+                    for event in events:
+                        ended += isinstance(event, ToolCallEnd)
+                        yield event
+            except AllEndpointsFailed as e:
+                # 首 token 之前就失败，还没有工具调用；在任务组外抛出，
+                # 调用方无需处理 ExceptionGroup
+                failure = e
+            else:
+                if route is not None and self.router is not None:
+                    self.router.record(
+                        route.turn_class,
+                        first_token_at - started if first_token_at else None,
+                        anyio.current_time() - started,
+                    )
 
-            if not tool_call_flag and content_arguments.startswith("<tool_call>"):
-                # print("content_arguments", content_arguments)
-                tool_call_flag = True
+                text, calls = parser.finish()
+                if text:
+                    response_message.append(text)
+                    yield TextDelta(text=text)
+                for event in dispatch(calls):
+                    yield event
 
-            if tools_call is not None and len(tools_call) > 0:
-                tool_call_flag = True
-                if tools_call[0].id is not None:
-                    function_id = tools_call[0].id
-                if tools_call[0].function.name is not None:
-                    function_name = tools_call[0].function.name
-                if tools_call[0].function.arguments is not None:
-                    function_arguments += tools_call[0].function.arguments
+                # 流已结束，逐个等待仍在执行的工具调用
+                while ended < len(function_calls):
+                    event = await receive_events.receive()
+                    ended += isinstance(event, ToolCallEnd)
+                    yield event
 
-            if content is not None and len(content) > 0:
-                if not tool_call_flag:
-                    response_message.append(content)
+        if failure is not None:
+            raise failure
 
         # 处理function call
-        if tool_call_flag:
-            bHasError = False
-            if function_id is None:
-                a = extract_json_from_string(content_arguments)
-                if a is not None:
-                    try:
-                        content_arguments_json = json.loads(a)
-                        function_name = content_arguments_json["name"]
-                        function_arguments = json.dumps(
-                            content_arguments_json["arguments"], ensure_ascii=False
-                        )
-                        function_id = str(uuid.uuid4().hex)
-                    except Exception as e:
-                        bHasError = True
-                        response_message.append(a)
-                else:
-                    bHasError = True
-                    response_message.append(content_arguments)
-                if bHasError:
-                    self.logger.error(f"function call error: {content_arguments}")
-            if not bHasError:
-                # 如需要大模型先处理一轮，添加相关处理后的日志情况
-                if len(response_message) > 0:
-                    text_buff = "".join(response_message)
-                    self.dialogue.append(Message(role="assistant", content=text_buff))
-                response_message.clear()
-                self.logger.debug(
-                    f"function_name={function_name}, function_id={function_id}, function_arguments={function_arguments}"
-                )
-                function_call_data = {
-                    "name": function_name,
-                    "id": function_id,
-                    "arguments": function_arguments,
-                }
-
-                # 使用统一工具处理器处理所有工具调用
-                result = await self.handle_llm_function_call(function_call_data)
-                respon = await self._handle_function_result(result, function_call_data)
-                response_message.append(respon)
+        if function_calls:
+            # 如需要大模型先处理一轮，添加相关处理后的日志情况
+            if len(response_message) > 0:
+                text_buff = "".join(response_message)
+                self.dialogue.append(Message(role="assistant", content=text_buff))
+
+            for event in self._record_function_results(results, function_calls):
+                yield event
+
+            # 后续一轮的回复由其自身写入对话
+            async for event in self._chat_turn(
+                "请根据以上工具调用结果，回复用户",
+                record_query=False,
+                route=route,
+                selection=selection,
+            ):
+                yield event
+            return
 
         # 存储对话内容
         if len(response_message) > 0:
             text_buff = "".join(response_message)
             self.tts_MessageText = text_buff
             self.dialogue.append(Message(role="assistant", content=text_buff))
+            # 只缓存没有调用工具的回复
+            if cache_key is not None:
+                self.response_cache.put(cache_key, text_buff)
 
-        return text_buff
+    async def chat(self, query) -> str:
+        """对话一轮并返回完整回复，需要边生成边输出时使用 chat_stream()"""
+        response_message = []
+        async for event in self.chat_stream(query):
+            if isinstance(event, TextDelta):
+                response_message.append(event.text)
+        return "".join(response_message)
 
 
-LLM = OpenAI(
+LLM = AsyncOpenAI(
     api_key=os.getenv("DASHSCOPE_API_KEY"),
     base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",  # 填
 )
 MODEL_NAME = "qwen-plus"
 
 
+async def repl(agent: ConversationalAgent):
+    print("input 'exit' or 'quit' exit")
+    print("input 'tools' show available tools")
+    print("=" * 50)
+
+    while True:
+        try:
+            # 在线程中等待输入，事件循环可以继续处理 MQTT 和后台任务
+            user_input = (await anyio.to_thread.run_sync(input, "\nuser: ")).strip()
+
+            if user_input.lower() in ["exit", "quit"]:
+                break
+
+            if user_input.lower() == "tools":
+                tools = await agent.get_tools()
+                print(f"available tools: {len(tools)}")
+
+                for tool in tools:
+                    function = tool.get("function", {})
+                    tool_name = function.get("name", str(tool))
+                    tool_desc = function.get("description") or "No description"
+                    print(f"- {tool_name}: {tool_desc}")
+                continue
+
+            if not user_input:
+                continue
+
+            # 边生成边输出
+            print("\nAgent: ", end="", flush=True)
+            async for event in agent.chat_stream(user_input):
+                if isinstance(event, TextDelta):
+                    print(event.text, end="", flush=True)
+                elif isinstance(event, ToolCallStart):
+                    print(f"[{event.name}]", end="", flush=True)
+            print()
+
+        except KeyboardInterrupt:
+            break
+        except Exception as e:
+            print(f"error: {e}")
+
+
 async def main():
     try:
         async with mcp_mqtt.MqttTransportClient(
@@ -381,45 +884,21 @@ async def main():
             await mcp_client.start()
             await anyio.sleep(3)
 
-            agent = ConversationalAgent(MODEL_NAME, LLM, mcp_client)
+            agent = ConversationalAgent(
+                MODEL_NAME,
+                LLM,
+                mcp_client,
+                blob_store=BlobStore(),
+                tool_selector=ToolSelector(pinned=("take_photo", "explain_photo")),
+            )
 
             await agent.init()
 
-            print("input 'exit' or 'quit' exit")
-            print("input 'tools' show available tools")
-            print("=" * 50)
-
-            while True:
-                try:
-                    user_input = input("\nuser: ").strip()
-
-                    if user_input.lower() in ["exit", "quit"]:
-                        break
-
-                    if user_input.lower() == "tools":
-                        # print(f"available tools: {len(agent.tools)}")
-                        tools = (
-                            await get_mcp_tools(agent.mcp_client)
-                            if agent.mcp_client
-                            else []
-                        )
-
-                        for tool in tools:
-                            tool_name = getattr(tool, "name", str(tool))
-                            tool_desc = getattr(tool, "description", "No description")
-                            print(f"- {tool_name}: {tool_desc}")
-                        continue
-
-                    if not user_input:
-                        continue
-
-                    response = await agent.chat(user_input)
-                    print(f"\nAgent: {response}")
-
-                except KeyboardInterrupt:
-                    break
-                except Exception as e:
-                    print(f"error: {e}")
+            async with anyio.create_task_group() as tg:
+                # 对话摘要在后台生成，不占用每轮对话的时间
+                tg.start_soon(agent.dialogue.run_summarizer)
+                await repl(agent)
+                tg.cancel_scope.cancel()
 
     except Exception as e:
         print(f"agent init error: {e}")
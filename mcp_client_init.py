@@ -1,8 +1,7 @@
 import asyncio
 import anyio
 import logging
-import re
-from typing import List, Optional, Union, cast, Any
+from typing import List, Optional, Union, cast
 from dataclasses import dataclass
 
 import mcp.client.mqtt as mcp_mqtt
@@ -10,7 +9,14 @@ from mcp.shared.mqtt import configure_logging
 import mcp.types as types
 
 from llama_index.core.tools import BaseTool, FunctionTool
-from pydantic import Field, create_model
+
+from util import (
+    ArgumentError,
+    BlobStore,
+    compile_schema,
+    render_tool_content,
+    validate_arguments,
+)
 
 # 配置日志
 configure_logging(level="DEBUG")
@@ -49,28 +55,17 @@ async def on_mcp_disconnect(client, server_name):
     logger.info(f"Disconnected from {server_name}")
 
 
-def build_fn_schema_from_input_schema(model_name: str, input_schema: dict):
-    """从 JSON Schema 构建 Pydantic 模型
-
-    将嵌套类型放宽为 Any。required 控制字段是否必需。
-    """
-    props = (input_schema or {}).get("properties", {}) or {}
-    required = set((input_schema or {}).get("required", []) or [])
-
-    fields = {}
-    for key, prop in props.items():
-        desc = prop.get("description") if isinstance(prop, dict) else None
-        default = ... if key in required else None
-        fields[key] = (Any, Field(default=default, description=desc))
-
-    class_name = re.sub(r"\W+", "_", f"{model_name}Params")
-    return create_model(class_name, **fields)
-
-
 async def get_mcp_tools(
-    mcp_client: mcp_mqtt.MqttTransportClient, server_name: str = "ESP32 Demo Server"
+    mcp_client: mcp_mqtt.MqttTransportClient,
+    server_name: str = "ESP32 Demo Server",
+    blob_store: Optional[BlobStore] = None,
 ) -> List[BaseTool]:
-    """获取 MCP 工具列表并转换为 LlamaIndex 工具格式"""
+    """
+    获取 MCP 工具列表并转换为 LlamaIndex 工具格式。
+
+    给出 blob_store 时，工具结果中的图片和二进制资源存入其中，返回给 LLM 的文本只包含
+    blob:// 引用；否则只保留类型。
+    """
     all_tools = []
     try:
         try:
@@ -85,9 +80,13 @@ async def get_mcp_tools(
             for tool in tools:
                 logger.info(f"tool: {tool.name} - {tool.description}")
 
-                def create_mcp_tool_wrapper(client_ref, server_name, tool_name):
+                def create_mcp_tool_wrapper(
+                    client_ref, server_name, tool_name, fn_schema
+                ):
                     async def mcp_tool_wrapper(**kwargs):
                         try:
+                            # 参数先在本地校验，错误的调用不再发往设备
+                            kwargs = validate_arguments(fn_schema, kwargs)
                             result = await client_ref.call_tool(
                                 server_name, tool_name, kwargs
                             )
@@ -97,34 +96,10 @@ async def get_mcp_tools(
                             call_result = cast(types.CallToolResult, result)
 
                             if hasattr(call_result, "content") and call_result.content:
-                                content_parts = []
-                                for content_item in call_result.content:
-                                    if hasattr(content_item, "type"):
-                                        if content_item.type == "text":
-                                            text_content = cast(
-                                                types.TextContent, content_item
-                                            )
-                                            content_parts.append(text_content.text)
-                                        elif content_item.type == "image":
-                                            image_content = cast(
-                                                types.ImageContent, content_item
-                                            )
-                                            content_parts.append(
-                                                f"[image: {image_content.mimeType}]"
-                                            )
-                                        elif content_item.type == "resource":
-                                            resource_content = cast(
-                                                types.EmbeddedResource, content_item
-                                            )
-                                            content_parts.append(
-                                                f"[resource: {resource_content.resource}]"
-                                            )
-                                        else:
-                                            content_parts.append(str(content_item))
-                                    else:
-                                        content_parts.append(str(content_item))
-
-                                result_text = "\n".join(content_parts)
+                                # 图片等二进制内容存入 blob store，对话中只保留引用
+                                result_text = render_tool_content(
+                                    call_result.content, blob_store
+                                )
 
                                 if (
                                     hasattr(call_result, "isError")
@@ -136,6 +111,10 @@ async def get_mcp_tools(
                             else:
                                 return str(call_result)
 
+                        except ArgumentError as e:
+                            error_msg = f"invalid arguments for {tool_name}: {e}"
+                            logger.error(error_msg)
+                            return error_msg
                         except Exception as e:
                             error_msg = f"call {tool_name} error: {e}"
                             logger.error(error_msg)
@@ -143,14 +122,12 @@ async def get_mcp_tools(
 
                     return mcp_tool_wrapper
 
-                wrapper_func = create_mcp_tool_wrapper(
-                    mcp_client, server_name, tool.name
-                )
-
                 try:
+                    # 按 schema 内容缓存，重新加载工具列表时直接复用
                     input_schema = getattr(tool, "inputSchema", {}) or {}
-                    fn_schema = build_fn_schema_from_input_schema(
-                        tool.name, input_schema
+                    fn_schema = compile_schema(tool.name, input_schema)
+                    wrapper_func = create_mcp_tool_wrapper(
+                        mcp_client, server_name, tool.name, fn_schema
                     )
                     llamaindex_tool = FunctionTool.from_defaults(
                         fn=wrapper_func,
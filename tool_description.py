@@ -4,10 +4,11 @@ from enum import Enum
 
 from dataclasses import dataclass
 from typing import Any, Dict, Optional
+import sys
 import uuid
 
 
-@dataclass
+@dataclass(slots=True)
 class ToolDefinition:
     """工具定义"""
 
@@ -15,8 +16,23 @@ class ToolDefinition:
     description: str  # 工具描述（OpenAI函数调用格式）
     parameters: Optional[Dict[str, Any]] = None  # 额外参数
 
+    def __post_init__(self):
+        # 多个会话加载同一批工具时共享名称和描述字符串
+        self.name = sys.intern(self.name)
+        if isinstance(self.description, str):
+            self.description = sys.intern(self.description)
+
 
 class Message:
+    """
+    对话消息。
+
+    使用 __slots__ 省去每条消息的 __dict__；system 消息的内容会被 intern，
+    大量会话共享同一份系统提示词。消息创建后视为不可变，to_dict() 的结果会被缓存。
+    """
+
+    __slots__ = ("role", "content", "tool_calls", "tool_call_id", "_dict")
+
     def __init__(
         self,
         role: str,
@@ -25,6 +41,26 @@ class Message:
         tool_calls=None,
         tool_call_id=None,
     ):
-        self.role = role
+        self.role = sys.intern(role)
+        if role == "system" and isinstance(content, str):
+            content = sys.intern(content)
         self.content = content
         self.tool_calls = tool_calls
+        self.tool_call_id = tool_call_id
+        self._dict = None
+
+    def to_dict(self) -> dict:
+        """转换为 OpenAI 消息格式，去掉值为 None 的字段"""
+        if self._dict is None:
+            d = {"role": self.role}
+            if self.content is not None:
+                d["content"] = self.content
+            if self.tool_calls is not None:
+                d["tool_calls"] = self.tool_calls
+            if self.tool_call_id is not None:
+                d["tool_call_id"] = self.tool_call_id
+            self._dict = d
+        return self._dict
+
+    def __repr__(self):
+        return f"Message({self.to_dict()!r})"
@@ -1,6 +1,78 @@
 from .prompt_loader import (load_system_prompt, load_json_prompt)
+from .tool_call_parser import StreamingToolCallParser
+from .dialogue import DialogueWindow, estimate_tokens, message_to_dict
+from .response_cache import ResponseCache, normalize_text
+from .hedged_llm import AllEndpointsFailed, HedgedLLM, LLMEndpoint
+from .model_router import ModelRouter, RouteDecision
+from .deadline import (
+    TIMEOUT_REPLY,
+    TurnDeadline,
+    current_deadline,
+    remaining_budget,
+    tool_call_budget,
+)
+from .image_preprocess import load_image_bytes, preprocess_image, to_data_url
+from .frame_index import BKTree, FrameIndex, dhash, hamming, image_hashes, phash
+from .frame_quality import FrameScore, best_frame, score_frames
+from .blob_store import Blob, BlobStore, render_tool_content
+from .vision import VisionService, current_device
+from .photo_prefetch import DEFAULT_VISUAL_PATTERNS, PhotoPrefetcher
+from .sentence_segmenter import SentenceSegmenter
+from .schema_compiler import (
+    ArgumentError,
+    compile_schema,
+    schema_cache_stats,
+    schema_hash,
+    validate_arguments,
+)
+from .tool_selector import ToolSelection, ToolSelector, minify_schema, minify_tool
 
 __all__ = [
     'load_system_prompt',
     'load_json_prompt',
-]
\ No newline at end of file
+    'StreamingToolCallParser',
+    'DialogueWindow',
+    'estimate_tokens',
+    'message_to_dict',
+    'ResponseCache',
+    'normalize_text',
+    'AllEndpointsFailed',
+    'HedgedLLM',
+    'LLMEndpoint',
+    'ModelRouter',
+    'RouteDecision',
+    'TIMEOUT_REPLY',
+    'TurnDeadline',
+    'current_deadline',
+    'remaining_budget',
+    'tool_call_budget',
+    'load_image_bytes',
+    'preprocess_image',
+    'to_data_url',
+    'BKTree',
+    'FrameIndex',
+    'dhash',
+    'hamming',
+    'image_hashes',
+    'phash',
+    'FrameScore',
+    'best_frame',
+    'score_frames',
+    'Blob',
+    'BlobStore',
+    'render_tool_content',
+    'VisionService',
+    'current_device',
+    'DEFAULT_VISUAL_PATTERNS',
+    'PhotoPrefetcher',
+    'SentenceSegmenter',
+    'ArgumentError',
+    'compile_schema',
+    'schema_cache_stats',
+    'schema_hash',
+    'validate_arguments',
+    'ToolSelection',
+    'ToolSelector',
+    'minify_schema',
+    'minify_tool',
+]
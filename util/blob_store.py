@@ -0,0 +1,219 @@
+import base64
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BLOB_SCHEME = "blob://"
+_OCTET_STREAM = "application/octet-stream"
+
+# 文本资源超过这个长度时也放进 blob store，对话里只留引用
+MAX_INLINE_TEXT = 2000
+
+
+@dataclass
+class Blob:
+    data: bytes
+    mime_type: str
+    digest: str  # data 的 sha256
+
+
+class BlobStore:
+    """
+    Bounded store of binary tool payloads, addressed by short handles.
+
+    Tool results put images and resources here and keep only a handle such as
+    ``blob://3fa2...`` in the conversation, so the prompt does not grow with
+    every photo. Handles are content addressed, the same payload is stored
+    once. When more than ``max_bytes`` are held, the least recently used blobs
+    are moved to ``spill_dir`` if given, else dropped; spilled blobs are
+    bounded by ``max_spill_bytes`` the same way. :meth:`get` returns the
+    stored bytes object itself, a spilled blob is read back into memory.
+
+    Spill files are written and read synchronously; use a local directory.
+
+    Args:
+        max_bytes: Bytes kept in memory
+        spill_dir: Directory for evicted blobs, None drops them
+        max_spill_bytes: Bytes kept in ``spill_dir``
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        spill_dir: Optional[str] = None,
+        max_spill_bytes: int = 512 * 1024 * 1024,
+    ):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._blobs: "OrderedDict[str, Blob]" = OrderedDict()
+        # handle -> (文件路径, 大小, mime, digest)
+        self._spilled: "OrderedDict[str, Tuple[str, int, str, str]]" = OrderedDict()
+        self.bytes = 0
+        self.spilled_bytes = 0
+        self.puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    @staticmethod
+    def is_handle(value) -> bool:
+        return isinstance(value, str) and value.startswith(BLOB_SCHEME)
+
+    def put(self, data: bytes, mime_type: str = _OCTET_STREAM) -> str:
+        """Store ``data`` and return its handle."""
+        self.puts += 1
+        digest = hashlib.sha256(data).hexdigest()
+        handle = BLOB_SCHEME + digest[:16]
+        if handle in self._blobs:
+            self._blobs.move_to_end(handle)
+            return handle
+        self._unspill(handle)
+        self._blobs[handle] = Blob(data, mime_type, digest)
+        self.bytes += len(data)
+        self._evict()
+        return handle
+
+    def get(self, handle: str) -> Optional[Blob]:
+        """The blob of a handle, or None if it was evicted or never stored."""
+        blob = self._blobs.get(handle)
+        if blob is not None:
+            self._blobs.move_to_end(handle)
+            self.hits += 1
+            return blob
+
+        spilled = self._spilled.get(handle)
+        if spilled is not None:
+            path, _, mime_type, digest = spilled
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError as e:
+                logger.warning(f"cannot read spilled blob {handle}: {e}")
+            else:
+                self._unspill(handle)
+                blob = self._blobs[handle] = Blob(data, mime_type, digest)
+                self.bytes += len(data)
+                self.hits += 1
+                self._evict()
+                return blob
+
+        self.misses += 1
+        return None
+
+    def _evict(self):
+        # 最新放入的 blob 即使超过上限也保留
+        while self.bytes > self.max_bytes and len(self._blobs) > 1:
+            handle, blob = self._blobs.popitem(last=False)
+            self.bytes -= len(blob.data)
+            self.evicted += 1
+            if self.spill_dir:
+                self._spill(handle, blob)
+
+        while self.spilled_bytes > self.max_spill_bytes and self._spilled:
+            handle = next(iter(self._spilled))
+            self._unspill(handle)
+
+    def _spill(self, handle: str, blob: Blob):
+        path = os.path.join(self.spill_dir, handle[len(BLOB_SCHEME) :])
+        try:
+            with open(path, "wb") as f:
+                f.write(blob.data)
+        except OSError as e:
+            logger.warning(f"cannot spill blob {handle}: {e}")
+            return
+        self._spilled[handle] = (path, len(blob.data), blob.mime_type, blob.digest)
+        self.spilled_bytes += len(blob.data)
+
+    def _unspill(self, handle: str):
+        spilled = self._spilled.pop(handle, None)
+        if spilled is None:
+            return
+        self.spilled_bytes -= spilled[1]
+        try:
+            os.remove(spilled[0])
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "blobs": len(self._blobs),
+            "bytes": self.bytes,
+            "spilled": len(self._spilled),
+            "spilled_bytes": self.spilled_bytes,
+            "puts": self.puts,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+        }
+
+
+def render_tool_content(
+    content: Iterable, blob_store: Optional[BlobStore] = None
+) -> str:
+    """
+    Text of an MCP tool result's content items for the conversation.
+
+    Images, audio and binary resources go to ``blob_store`` and are replaced by
+    ``[image image/jpeg blob://...]`` style references; without a store only
+    the type is kept. Long text resources are stored the same way.
+    """
+    parts = []
+    for item in content or []:
+        item_type = getattr(item, "type", None)
+        if item_type == "text":
+            parts.append(item.text)
+        elif item_type in ("image", "audio"):
+            parts.append(
+                _reference(
+                    item_type,
+                    item.mimeType,
+                    lambda: base64.b64decode(item.data),
+                    blob_store,
+                )
+            )
+        elif item_type == "resource":
+            resource = item.resource
+            mime_type = getattr(resource, "mimeType", None) or _OCTET_STREAM
+            label = f"resource {resource.uri}"
+            text = getattr(resource, "text", None)
+            if text is not None and len(text) <= MAX_INLINE_TEXT:
+                parts.append(f"[{label}]\n{text}")
+            elif text is not None:
+                parts.append(
+                    _reference(
+                        label, mime_type, lambda: text.encode("utf-8"), blob_store
+                    )
+                )
+            else:
+                parts.append(
+                    _reference(
+                        label,
+                        mime_type,
+                        lambda: base64.b64decode(resource.blob),
+                        blob_store,
+                    )
+                )
+        elif item_type == "resource_link":
+            parts.append(f"[resource {item.uri}]")
+        else:
+            parts.append(str(item))
+    return "\n".join(parts)
+
+
+def _reference(label: str, mime_type: str, load, blob_store: Optional[BlobStore]):
+    if blob_store is None:
+        return f"[{label}: {mime_type}]"
+    try:
+        handle = blob_store.put(load(), mime_type)
+    except Exception as e:
+        logger.warning(f"cannot store {label}: {e}")
+        return f"[{label}: {mime_type}]"
+    return f"[{label} {mime_type} {handle}]"
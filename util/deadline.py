@@ -0,0 +1,120 @@
+import math
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+import anyio
+
+# 超时后代替模型回复的兜底话术
+TIMEOUT_REPLY = "抱歉，我刚才没反应过来，可以再说一遍吗？"
+
+_current_deadline: ContextVar[Optional["TurnDeadline"]] = ContextVar(
+    "turn_deadline", default=None
+)
+
+
+class TurnDeadline:
+    """
+    Time budget of one conversational turn.
+
+    Until the first speech is produced the turn must finish within
+    ``first_speech`` seconds; once :meth:`mark_spoke` is called the limit is
+    relaxed to ``total`` seconds from the start of the turn. Tool calls are not
+    charged to the first-speech budget: after :meth:`mark_tool_call` only
+    ``total`` applies, and silence is still answered with the fallback reply. Everything awaited
+    inside :meth:`scope` is cancelled when the budget runs out, and code that
+    runs outside the scope (tasks started by a workflow engine, tool wrappers)
+    can read the remaining budget through :func:`remaining_budget`.
+
+    Args:
+        first_speech: Seconds allowed before the first speech, None for no limit
+        total: Seconds allowed for the whole turn, None for no limit
+    """
+
+    def __init__(
+        self, first_speech: Optional[float] = 3.0, total: Optional[float] = 30.0
+    ):
+        self.first_speech = first_speech
+        self.total = total
+        self.started: Optional[float] = None
+        self.spoke = False
+        self.called_tools = False
+        self._scope: Optional[anyio.CancelScope] = None
+
+    @property
+    def deadline(self) -> float:
+        """Absolute deadline on the anyio clock, ``inf`` when unlimited."""
+        if self.started is None:
+            return math.inf
+        limits = [self.total]
+        if not self.spoke and not self.called_tools:
+            limits.append(self.first_speech)
+        return self.started + min(
+            (limit for limit in limits if limit is not None), default=math.inf
+        )
+
+    def remaining(self) -> float:
+        return self.deadline - anyio.current_time()
+
+    @property
+    def expired(self) -> bool:
+        return self._scope is not None and self._scope.cancelled_caught
+
+    def mark_spoke(self):
+        """Record the first speech and extend the budget to ``total``."""
+        if self.spoke:
+            return
+        self.spoke = True
+        self._extend()
+
+    def mark_tool_call(self):
+        """Record a tool call and extend the budget to ``total``."""
+        if self.called_tools:
+            return
+        self.called_tools = True
+        self._extend()
+
+    def _extend(self):
+        if self._scope is not None:
+            self._scope.deadline = self.deadline
+
+    @contextmanager
+    def scope(self) -> Iterator["TurnDeadline"]:
+        """
+        Run the turn under this budget.
+
+        Must not span a ``yield`` of an async generator; run the turn in its own
+        task and forward its events instead.
+        """
+        self.started = anyio.current_time()
+        token = _current_deadline.set(self)
+        try:
+            with anyio.CancelScope(deadline=self.deadline) as scope:
+                self._scope = scope
+                yield self
+        finally:
+            _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[TurnDeadline]:
+    return _current_deadline.get()
+
+
+def remaining_budget(default: float = math.inf) -> float:
+    """Seconds left in the current turn, ``default`` outside of a turn."""
+    deadline = _current_deadline.get()
+    return deadline.remaining() if deadline is not None else default
+
+
+def tool_call_budget(default: float = math.inf) -> float:
+    """
+    Mark a tool call on the current turn and return the seconds it may take.
+
+    Tool wrappers call this when they start, so a tool is bounded by the
+    turn's total budget rather than by the first-speech one.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return default
+    deadline.mark_tool_call()
+    return deadline.remaining()
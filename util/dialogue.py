@@ -0,0 +1,262 @@
+import json
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional, Sequence
+
+import anyio
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "以下是之前对话的摘要：\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token estimate used when no tokenizer is configured.
+
+    CJK characters count as one token each, everything else as a quarter token.
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "⺀" <= ch <= "鿿" or "豈" <= ch <= "￯")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_to_dict(message) -> dict:
+    """Serialize a message for the chat completions API, dropping None fields."""
+    to_dict = getattr(message, "to_dict", None)
+    if to_dict is not None:
+        return to_dict()
+    return {k: v for k, v in vars(message).items() if v is not None}
+
+
+def _message_text(message) -> str:
+    parts = []
+    content = getattr(message, "content", None)
+    if content:
+        parts.append(content if isinstance(content, str) else str(content))
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        parts.append(json.dumps(tool_calls, ensure_ascii=False, default=str))
+    return "".join(parts)
+
+
+class DialogueWindow:
+    """
+    Token-budgeted conversation history.
+
+    The first system message is pinned. Everything else is grouped into atomic
+    units: an assistant message with ``tool_calls`` and the ``tool`` messages
+    answering it are one unit, every other message is a unit of its own. When
+    the window exceeds ``max_tokens`` the oldest units are evicted and handed to
+    ``summarizer`` in the background (see :meth:`run_summarizer`); the running
+    summary is sent right after the system message. Turns are evicted whole,
+    from a user message up to the next one, so the history never starts with
+    an orphaned reply. The current turn, from the most recent user message on,
+    is never evicted, even when a large tool result alone exceeds the budget.
+
+    Every message is serialized once when it is appended. :meth:`payload`
+    returns the same append-only list of dicts turn after turn and only rebuilds
+    it after an eviction or summary update, so building a request costs O(new
+    messages) and the request prefix stays byte-stable for provider-side prompt
+    caching.
+
+    Args:
+        max_tokens: Token budget for system message, summary and history
+        tokenizer: Callable returning the token count of a string, defaults to
+            :func:`estimate_tokens`
+        summarizer: Async callable ``(summary, evicted_messages) -> new_summary``;
+            evicted turns are dropped when it is None
+        message_factory: Callable ``(role, content)`` used to build the summary
+            message
+        serializer: Callable converting a message into a request dict, defaults
+            to :func:`message_to_dict`
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 4000,
+        tokenizer: Optional[Callable[[str], int]] = None,
+        summarizer: Optional[Callable[[str, list], Awaitable[str]]] = None,
+        message_factory: Optional[Callable] = None,
+        serializer: Optional[Callable[[object], dict]] = None,
+    ):
+        self.max_tokens = max_tokens
+        self.tokenizer = tokenizer or estimate_tokens
+        self.summarizer = summarizer
+        self.message_factory = message_factory
+        self.serializer = serializer or message_to_dict
+        self.system = None
+        self.summary = ""
+        self._system_tokens = 0
+        self._summary_tokens = 0
+        self._summary_message = None
+        # [消息列表, 序列化后的 dict 列表, token 数]，最旧的在左边
+        self._groups: Deque[list] = deque()
+        self._history_tokens = 0
+        # 已序列化的请求消息，仅追加；淘汰旧消息或更新摘要后才重建
+        self._payload: List[dict] = []
+        self._payload_dirty = False
+        self._evicted: list = []
+        self._evicted_event: Optional[anyio.Event] = None
+
+    @property
+    def tokens(self) -> int:
+        return self._system_tokens + self._summary_tokens + self._history_tokens
+
+    def count_tokens(self, message) -> int:
+        return self.tokenizer(_message_text(message))
+
+    def append(self, message):
+        if message.role == "system" and self.system is None and not self._groups:
+            self.system = message
+            self._system_tokens = self.count_tokens(message)
+            self._payload_dirty = True
+            return
+
+        tokens = self.count_tokens(message)
+        serialized = self.serializer(message)
+        last = self._groups[-1] if self._groups else None
+        if (
+            message.role == "tool"
+            and last is not None
+            and getattr(last[0][0], "tool_calls", None)
+        ):
+            # tool 结果与发起调用的 assistant 消息属于同一单元
+            last[0].append(message)
+            last[1].append(serialized)
+            last[2] += tokens
+        else:
+            self._groups.append([[message], [serialized], tokens])
+        self._payload.append(serialized)
+        self._history_tokens += tokens
+        self._enforce_budget()
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def messages(self) -> List:
+        """Messages to send, in order: system, summary, history."""
+        result = []
+        if self.system is not None:
+            result.append(self.system)
+        if self._summary_message is not None:
+            result.append(self._summary_message)
+        for group, _, _ in self._groups:
+            result.extend(group)
+        return result
+
+    def recent_messages(
+        self, limit: int, roles: Optional[Sequence[str]] = None
+    ) -> List:
+        """
+        The last ``limit`` history messages, oldest first.
+
+        With ``roles``, only messages of those roles are counted and returned,
+        and tool call units are skipped as a whole.
+        """
+        result = []
+        for group, _, _ in reversed(self._groups):
+            if roles is not None:
+                if getattr(group[0], "tool_calls", None):
+                    continue
+                group = [message for message in group if message.role in roles]
+            result[:0] = group
+            if len(result) >= limit:
+                break
+        return result[-limit:] if limit > 0 else []
+
+    def payload(self) -> List[dict]:
+        """
+        Serialized messages in the same order as :meth:`messages`.
+
+        The returned list is owned by the window and must not be mutated.
+        """
+        if self._payload_dirty:
+            payload = []
+            if self.system is not None:
+                payload.append(self.serializer(self.system))
+            if self._summary_message is not None:
+                payload.append(self.serializer(self._summary_message))
+            for _, serialized, _ in self._groups:
+                payload.extend(serialized)
+            self._payload = payload
+            self._payload_dirty = False
+        return self._payload
+
+    def __iter__(self):
+        return iter(self.messages())
+
+    def __len__(self):
+        return (
+            (self.system is not None)
+            + (self._summary_message is not None)
+            + sum(len(group) for group, _, _ in self._groups)
+        )
+
+    def _current_turn_groups(self) -> int:
+        """Number of units from the most recent user message on"""
+        for count, (group, _, _) in enumerate(reversed(self._groups), 1):
+            if group[0].role == "user":
+                return count
+        # 没有用户消息时至少保留最新的一个单元
+        return 1
+
+    def _enforce_budget(self):
+        if self.tokens <= self.max_tokens:
+            return
+        # 只淘汰更早的轮次：本轮的提问和进行中的工具调用不能被拆开
+        pinned = self._current_turn_groups()
+        while self.tokens > self.max_tokens and len(self._groups) > pinned:
+            # 整轮淘汰：从用户消息到下一条用户消息之前，历史不会以孤立的回复开头
+            while True:
+                self._evict_group()
+                if (
+                    len(self._groups) <= pinned
+                    or self._groups[0][0][0].role == "user"
+                ):
+                    break
+        if self._evicted and self._evicted_event is not None:
+            self._evicted_event.set()
+
+    def _evict_group(self):
+        group, _, tokens = self._groups.popleft()
+        self._history_tokens -= tokens
+        self._payload_dirty = True
+        # 摘要任务未运行时直接丢弃，避免无限堆积
+        if self.summarizer is not None and self._evicted_event is not None:
+            self._evicted.extend(group)
+
+    def set_summary(self, summary: str):
+        self.summary = summary
+        self._payload_dirty = True
+        if not summary or self.message_factory is None:
+            self._summary_message = None
+            self._summary_tokens = 0
+            return
+        self._summary_message = self.message_factory(
+            role="system", content=SUMMARY_PREFIX + summary
+        )
+        self._summary_tokens = self.count_tokens(self._summary_message)
+        self._enforce_budget()
+
+    async def run_summarizer(self):
+        """
+        Background worker folding evicted turns into the running summary.
+
+        Run it in a task group next to the conversation; summarization then
+        never sits on the critical path of a turn.
+        """
+        while True:
+            self._evicted_event = anyio.Event()
+            if not self._evicted:
+                await self._evicted_event.wait()
+            evicted, self._evicted = self._evicted, []
+            try:
+                summary = await self.summarizer(self.summary, evicted)
+            except Exception as e:
+                logger.error(f"summarize dialogue error: {e}")
+                continue
+            self.set_summary(summary)
+            logger.debug(f"dialogue summary updated, {self.tokens} tokens in window")
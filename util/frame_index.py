@@ -0,0 +1,238 @@
+import io
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# pHash 取 32x32 灰度图 DCT 的左上 8x8 低频分量
+_PHASH_SIZE = 32
+_HASH_SIZE = 8
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix, ``D @ x`` transforms the columns of ``x``."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(_PHASH_SIZE)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def phash(gray: np.ndarray) -> int:
+    """64-bit perceptual hash of a 32x32 grayscale array."""
+    low = (_DCT @ gray @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE].ravel()
+    # 直流分量不参与中位数
+    return _bits_to_int(low > np.median(low[1:]))
+
+
+def dhash(gray: np.ndarray) -> int:
+    """64-bit difference hash of an 8x9 (rows x columns) grayscale array."""
+    return _bits_to_int(gray[:, 1:] > gray[:, :-1])
+
+
+def image_hashes(data: bytes) -> Tuple[int, int]:
+    """
+    Decode an image and return its ``(phash, dhash)``.
+
+    JPEGs are decoded at reduced resolution, which is enough for 32x32 hashes.
+    CPU bound; run it in a worker thread.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("L", (_PHASH_SIZE * 2, _PHASH_SIZE * 2))
+        gray = image.convert("L")
+        small = np.asarray(
+            gray.resize((_PHASH_SIZE, _PHASH_SIZE), Image.Resampling.BILINEAR),
+            dtype=np.float64,
+        )
+        tiny = np.asarray(
+            gray.resize((_HASH_SIZE + 1, _HASH_SIZE), Image.Resampling.BILINEAR),
+            dtype=np.int16,
+        )
+    return phash(small), dhash(tiny)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+@dataclass
+class FrameEntry:
+    phash: int
+    dhash: int
+    added: float
+    # 归一化后的问题 -> VLM 回答
+    answers: Dict[str, str] = field(default_factory=dict)
+
+
+class BKTree:
+    """BK-tree over 64-bit hashes for Hamming-radius queries."""
+
+    def __init__(self):
+        # [hash, 同一 hash 的条目, {距离: 子节点}]
+        self._root: Optional[list] = None
+
+    def add(self, key: int, item):
+        if self._root is None:
+            self._root = [key, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [item], {}]
+                return
+            node = child
+
+    def search(self, key: int, radius: int) -> Iterator[Tuple[int, object]]:
+        """Yield ``(distance, item)`` for every item within ``radius`` of ``key``."""
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node[0])
+            if distance <= radius:
+                for item in node[1]:
+                    yield distance, item
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+
+
+class FrameIndex:
+    """
+    Per-device index of recent camera frames and the VLM answers about them.
+
+    Frames are compared by pHash Hamming distance through a BK-tree and
+    confirmed with dHash, so frames that differ only by sensor noise match
+    while a changed scene does not. Each device keeps at most ``max_frames``
+    frames for ``ttl`` seconds.
+
+    Args:
+        phash_threshold: Maximum pHash distance (of 64 bits) of a near-duplicate
+        dhash_threshold: Maximum dHash distance of a near-duplicate
+        max_frames: Frames kept per device, oldest evicted first
+        ttl: Seconds a frame stays reusable
+        clock: Monotonic clock, replaceable for tests
+    """
+
+    def __init__(
+        self,
+        phash_threshold: int = 8,
+        dhash_threshold: int = 12,
+        max_frames: int = 32,
+        ttl: float = 120.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.phash_threshold = phash_threshold
+        self.dhash_threshold = dhash_threshold
+        self.max_frames = max_frames
+        self.ttl = ttl
+        self.clock = clock
+        self.lookups = 0
+        self.hits = 0
+        # 找到相似帧但问题不同
+        self.frame_matches = 0
+        self.hit_distances: List[int] = []
+        self._frames: Dict[str, Deque[FrameEntry]] = {}
+        self._trees: Dict[str, BKTree] = {}
+
+    def lookup(
+        self, device_id: str, hashes: Tuple[int, int], question: str
+    ) -> Optional[str]:
+        """Return the stored answer to ``question`` about a near-identical frame."""
+        self.lookups += 1
+        self._expire(device_id)
+        tree = self._trees.get(device_id)
+        if tree is None:
+            return None
+
+        phash_value, dhash_value = hashes
+        best = None
+        frame_matched = False
+        for distance, entry in tree.search(phash_value, self.phash_threshold):
+            if hamming(dhash_value, entry.dhash) > self.dhash_threshold:
+                continue
+            frame_matched = True
+            if question in entry.answers and (best is None or distance < best[0]):
+                best = (distance, entry)
+
+        if best is None:
+            self.frame_matches += frame_matched
+            return None
+        self.hits += 1
+        self.hit_distances.append(best[0])
+        del self.hit_distances[:-1000]
+        logger.debug(f"near-duplicate frame for {device_id}, distance {best[0]}")
+        return best[1].answers[question]
+
+    def add(
+        self, device_id: str, hashes: Tuple[int, int], question: str, answer: str
+    ):
+        frames = self._frames.setdefault(device_id, deque())
+        entry = FrameEntry(hashes[0], hashes[1], self.clock(), {question: answer})
+        frames.append(entry)
+        if len(frames) > self.max_frames:
+            frames.popleft()
+            self._rebuild(device_id)
+        else:
+            self._trees.setdefault(device_id, BKTree()).add(entry.phash, entry)
+
+    def _expire(self, device_id: str):
+        frames = self._frames.get(device_id)
+        if not frames:
+            return
+        deadline = self.clock() - self.ttl
+        if frames[0].added > deadline:
+            return
+        while frames and frames[0].added <= deadline:
+            frames.popleft()
+        self._rebuild(device_id)
+
+    def _rebuild(self, device_id: str):
+        # 帧数很少，淘汰时直接重建比在 BK 树中删除节点简单
+        frames = self._frames[device_id]
+        if not frames:
+            del self._frames[device_id]
+            self._trees.pop(device_id, None)
+            return
+        tree = BKTree()
+        for entry in frames:
+            tree.add(entry.phash, entry)
+        self._trees[device_id] = tree
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "phash_threshold": self.phash_threshold,
+            "dhash_threshold": self.dhash_threshold,
+            "devices": len(self._frames),
+            "frames": sum(len(frames) for frames in self._frames.values()),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "frame_matches": self.frame_matches,
+            "hit_rate": self.hit_rate,
+            "mean_hit_distance": (
+                sum(self.hit_distances) / len(self.hit_distances)
+                if self.hit_distances
+                else None
+            ),
+        }
@@ -0,0 +1,96 @@
+import io
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# 评分前统一缩放到的尺寸，保证整组照片可以堆叠成一个数组
+SCORE_SIZE = (320, 240)
+
+
+@dataclass
+class FrameScore:
+    index: int
+    sharpness: float  # 拉普拉斯响应的方差，越大越清晰
+    brightness: float  # 平均亮度 0-255
+    clipped: float  # 过暗或过曝像素的比例
+    exposure_ok: bool
+
+
+def _decode_gray(data: bytes, size: Tuple[int, int]) -> np.ndarray:
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("L", size)
+        gray = image.convert("L").resize(size, Image.Resampling.BILINEAR)
+        return np.asarray(gray, dtype=np.float32)
+
+
+def score_frames(
+    frames: Sequence[Optional[bytes]],
+    size: Tuple[int, int] = SCORE_SIZE,
+    min_brightness: float = 40.0,
+    max_brightness: float = 215.0,
+    max_clipped: float = 0.25,
+) -> List[Optional[FrameScore]]:
+    """
+    Score a burst of encoded frames for sharpness and exposure.
+
+    Frames are decoded to grayscale at ``size`` and stacked, so the Laplacian
+    and the exposure statistics are computed for the whole burst in single
+    array operations. Frames that are None or fail to decode score None.
+    CPU bound; run it in a worker thread.
+    """
+    decoded = []
+    indexes = []
+    for index, data in enumerate(frames):
+        if data is None:
+            continue
+        try:
+            decoded.append(_decode_gray(data, size))
+        except Exception as e:
+            logger.warning(f"cannot decode frame {index}: {e}")
+            continue
+        indexes.append(index)
+
+    scores: List[Optional[FrameScore]] = [None] * len(frames)
+    if not decoded:
+        return scores
+
+    burst = np.stack(decoded)  # (N, H, W)
+    laplacian = (
+        burst[:, :-2, 1:-1]
+        + burst[:, 2:, 1:-1]
+        + burst[:, 1:-1, :-2]
+        + burst[:, 1:-1, 2:]
+        - 4.0 * burst[:, 1:-1, 1:-1]
+    )
+    sharpness = laplacian.var(axis=(1, 2))
+    brightness = burst.mean(axis=(1, 2))
+    clipped = ((burst <= 5.0) | (burst >= 250.0)).mean(axis=(1, 2))
+    exposure_ok = (
+        (brightness >= min_brightness)
+        & (brightness <= max_brightness)
+        & (clipped <= max_clipped)
+    )
+
+    for row, index in enumerate(indexes):
+        scores[index] = FrameScore(
+            index=index,
+            sharpness=float(sharpness[row]),
+            brightness=float(brightness[row]),
+            clipped=float(clipped[row]),
+            exposure_ok=bool(exposure_ok[row]),
+        )
+    return scores
+
+
+def best_frame(scores: Sequence[Optional[FrameScore]]) -> Optional[int]:
+    """Index of the sharpest well-exposed frame, else of the sharpest frame."""
+    scored = [score for score in scores if score is not None]
+    if not scored:
+        return None
+    well_exposed = [score for score in scored if score.exposure_ok]
+    return max(well_exposed or scored, key=lambda score: score.sharpness).index
@@ -0,0 +1,161 @@
+import logging
+import math
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import anyio
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LLMEndpoint:
+    """An OpenAI-compatible endpoint and the model to request from it."""
+
+    client: Any  # AsyncOpenAI
+    model: str
+    name: str = ""
+
+    def __post_init__(self):
+        if not self.name:
+            self.name = f"{getattr(self.client, 'base_url', '')}#{self.model}"
+
+
+class AllEndpointsFailed(Exception):
+    """Every endpoint failed before producing a first token."""
+
+    def __init__(self, errors: List[tuple]):
+        self.errors = errors
+        detail = "; ".join(f"{endpoint.name}: {error!r}" for endpoint, error in errors)
+        super().__init__(f"all LLM endpoints failed: {detail}")
+
+
+@dataclass
+class HedgeStats:
+    requests: int = 0
+    hedged: int = 0  # 因首 token 超时而发出的对冲请求数
+    fallbacks: int = 0  # 因请求失败而切换到下一个端点的次数
+    wins: Dict[str, int] = field(default_factory=dict)
+
+
+class HedgedLLM:
+    """
+    Streams chat completions from a list of endpoints with a first-token deadline.
+
+    The first endpoint is requested immediately. If it has not produced a chunk
+    within ``first_token_deadline`` seconds, the next endpoint is requested as a
+    hedge; if a request fails, the next endpoint is requested right away. The
+    first stream to produce a chunk wins and every other request is cancelled.
+
+    Args:
+        endpoints: Endpoints in order of preference
+        first_token_deadline: Seconds to wait for a first chunk before hedging
+    """
+
+    def __init__(self, endpoints: List[LLMEndpoint], first_token_deadline: float = 2.0):
+        if not endpoints:
+            raise ValueError("at least one LLM endpoint is required")
+        self.endpoints = endpoints
+        self.first_token_deadline = first_token_deadline
+        self.stats = HedgeStats()
+
+    async def stream(self, model: Optional[str] = None, **request) -> AsyncIterator[Any]:
+        """
+        Yield chunks of the winning stream.
+
+        ``model`` overrides the model of the first endpoint only; fallback
+        endpoints keep their own models.
+        """
+        endpoint, stream, iterator, first = await self._race(request, model)
+        self.stats.wins[endpoint.name] = self.stats.wins.get(endpoint.name, 0) + 1
+        try:
+            yield first
+            async for chunk in iterator:
+                yield chunk
+        finally:
+            with anyio.CancelScope(shield=True):
+                await stream.close()
+
+    async def _race(self, request: dict, model: Optional[str]) -> tuple:
+        self.stats.requests += 1
+        send, receive = anyio.create_memory_object_stream(math.inf)
+
+        async def attempt(endpoint: LLMEndpoint):
+            stream = None
+            try:
+                stream = await endpoint.client.chat.completions.create(
+                    model=(
+                        model
+                        if model and endpoint is self.endpoints[0]
+                        else endpoint.model
+                    ),
+                    stream=True,
+                    **request,
+                )
+                iterator = stream.__aiter__()
+                first = await iterator.__anext__()
+            except anyio.get_cancelled_exc_class():
+                if stream is not None:
+                    with anyio.CancelScope(shield=True):
+                        await stream.close()
+                raise
+            except (Exception, StopAsyncIteration) as e:
+                if stream is not None:
+                    await stream.close()
+                send.send_nowait(("failed", endpoint, e))
+                return
+            send.send_nowait(("won", endpoint, (stream, iterator, first)))
+
+        errors: List[tuple] = []
+        winner = None
+        launched = 0
+        pending = 0
+        async with anyio.create_task_group() as tg:
+
+            def launch():
+                nonlocal launched, pending
+                tg.start_soon(attempt, self.endpoints[launched])
+                launched += 1
+                pending += 1
+
+            launch()
+            while winner is None and pending > 0:
+                can_hedge = launched < len(self.endpoints)
+                with anyio.move_on_after(
+                    self.first_token_deadline if can_hedge else math.inf
+                ) as scope:
+                    kind, endpoint, value = await receive.receive()
+                if scope.cancelled_caught:
+                    logger.warning(
+                        f"no first token within {self.first_token_deadline}s, "
+                        f"hedging to {self.endpoints[launched].name}"
+                    )
+                    self.stats.hedged += 1
+                    launch()
+                    continue
+
+                pending -= 1
+                if kind == "won":
+                    winner = (endpoint, *value)
+                    break
+                logger.error(f"LLM endpoint {endpoint.name} failed: {value!r}")
+                errors.append((endpoint, value))
+                if launched < len(self.endpoints):
+                    self.stats.fallbacks += 1
+                    launch()
+
+            # 取消仍在等待首 token 的请求
+            tg.cancel_scope.cancel()
+
+        # 几乎同时拿到首 token 的落败者，关闭其连接
+        while True:
+            try:
+                kind, endpoint, value = receive.receive_nowait()
+            except anyio.WouldBlock:
+                break
+            if kind == "won":
+                await value[0].close()
+
+        if winner is None:
+            raise AllEndpointsFailed(errors)
+        return winner
@@ -0,0 +1,79 @@
+import base64
+import binascii
+import io
+import os
+from typing import Optional
+from urllib.parse import unquote, urlparse
+
+from PIL import Image, ImageOps
+
+
+def load_image_bytes(
+    image_url: str, local_dir: Optional[str] = None
+) -> Optional[bytes]:
+    """
+    Read the raw bytes behind a data URL, a ``file://`` URL or a local path.
+
+    Local files are only read from inside ``local_dir``, after resolving
+    symlinks and ``..``; without it they are refused, since the URL may come
+    from the model. Returns None for remote URLs, which are left for the model
+    to fetch. Raises ValueError for a malformed data URL or a refused path and
+    OSError for unreadable files.
+    """
+    if image_url.startswith("data:"):
+        header, sep, payload = image_url.partition(",")
+        if not sep:
+            raise ValueError("malformed data URL")
+        try:
+            if header.endswith(";base64"):
+                return base64.b64decode(payload, validate=False)
+            return unquote(payload).encode("latin-1")
+        except (binascii.Error, UnicodeEncodeError) as e:
+            raise ValueError(f"malformed data URL: {e}") from e
+
+    if image_url.startswith("file://"):
+        path = unquote(urlparse(image_url).path)
+    elif "://" not in image_url:
+        path = image_url
+    else:
+        return None
+    if local_dir is None:
+        raise ValueError("local image files are not allowed")
+    root = os.path.realpath(local_dir)
+    path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"image outside {local_dir} is not allowed")
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def preprocess_image(
+    data: bytes, max_edge: Optional[int] = 1024, quality: int = 80
+) -> bytes:
+    """
+    Downsize an image so its longer edge is at most ``max_edge`` and re-encode
+    it as JPEG at ``quality``.
+
+    The EXIF orientation is applied first. The original bytes are returned when
+    they are already a JPEG within ``max_edge`` that re-encoding would not
+    shrink. CPU bound; run it in a worker thread.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        source_format = image.format
+        image = ImageOps.exif_transpose(image)
+        resized = max_edge is not None and max(image.size) > max_edge
+        if resized:
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+
+    encoded = buffer.getvalue()
+    if source_format == "JPEG" and not resized and len(encoded) >= len(data):
+        return data
+    return encoded
+
+
+def to_data_url(data: bytes, mime_type: str = "image/jpeg") -> str:
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
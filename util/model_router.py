@@ -0,0 +1,159 @@
+import logging
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+TURN_CHAT = "chat"  # 寒暄、闲聊，交给小模型
+TURN_TOOL = "tool"  # 可能需要调用工具
+TURN_COMPLEX = "complex"  # 较长、较复杂的问题
+
+DEFAULT_TIERS = {
+    TURN_CHAT: "qwen-turbo",
+    TURN_TOOL: "qwen-plus",
+    TURN_COMPLEX: "qwen-plus",
+}
+
+# 提示需要动手或需要感知环境的关键词
+DEFAULT_TOOL_KEYWORDS = (
+    "看看", "看一下", "拍", "照片", "相机", "摄像头", "打扮", "衣服", "穿",
+    "打开", "关闭", "关掉", "开灯", "关灯", "音量", "声音", "亮度", "电量",
+    "温度", "天气", "几点", "时间", "设置", "调高", "调低", "播放", "停止",
+)
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an the of to and or is are be for in on at with this that it its you i me my "
+    "your can do does what how".split()
+)
+_CJK = re.compile(r"[一-鿿]+")
+
+
+def _tokens(text: str) -> set:
+    """英文按单词切分（take_photo -> take, photo），中文取相邻两字"""
+    text = (text or "").lower()
+    tokens = set(_WORD.findall(text)) - _STOPWORDS
+    for run in _CJK.findall(text):
+        tokens.update(run[i : i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+@dataclass
+class RouteDecision:
+    turn_class: str
+    model: str
+    reason: str
+
+
+@dataclass
+class TierStats:
+    """Rolling latency samples of one tier, in seconds."""
+
+    window: int = 200
+    count: int = 0
+    first_token: Deque[float] = field(default_factory=deque)
+    total: Deque[float] = field(default_factory=deque)
+
+    def record(self, first_token: Optional[float], total: float):
+        self.count += 1
+        if first_token is not None:
+            self.first_token.append(first_token)
+        self.total.append(total)
+        while len(self.first_token) > self.window:
+            self.first_token.popleft()
+        while len(self.total) > self.window:
+            self.total.popleft()
+
+    @staticmethod
+    def _percentile(samples: Iterable[float], q: float) -> Optional[float]:
+        ordered = sorted(samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "first_token_p50": self._percentile(self.first_token, 0.5),
+            "first_token_p95": self._percentile(self.first_token, 0.95),
+            "total_p50": self._percentile(self.total, 0.5),
+            "total_p95": self._percentile(self.total, 0.95),
+        }
+
+
+class ModelRouter:
+    """
+    Cheap per-turn classifier picking a model tier for each utterance.
+
+    A turn is ``tool`` when it contains a tool keyword or shares at least
+    ``min_tool_overlap`` tokens with the tool catalog's names and descriptions,
+    ``complex`` when it is longer than ``long_chars``, and ``chat`` otherwise.
+    ``tiers`` maps each class to a model name. Latencies recorded per class can
+    be read from :meth:`report` to tune the thresholds.
+
+    Args:
+        tiers: Turn class -> model name, missing classes fall back to ``tool``
+        tool_keywords: Substrings that mark a turn as likely to need tools
+        min_tool_overlap: Catalog tokens a turn must share to count as ``tool``
+        long_chars: Length above which a non-tool turn is ``complex``
+    """
+
+    def __init__(
+        self,
+        tiers: Optional[Dict[str, str]] = None,
+        tool_keywords: Sequence[str] = DEFAULT_TOOL_KEYWORDS,
+        min_tool_overlap: int = 2,
+        long_chars: int = 60,
+    ):
+        self.tiers = dict(DEFAULT_TIERS if tiers is None else tiers)
+        self.tool_keywords = tuple(tool_keywords)
+        self.min_tool_overlap = min_tool_overlap
+        self.long_chars = long_chars
+        self.stats: Dict[str, TierStats] = {}
+        self._catalog_key: Optional[Tuple[str, ...]] = None
+        self._catalog_tokens: set = set()
+
+    def model_for(self, turn_class: str) -> str:
+        return self.tiers.get(turn_class) or self.tiers[TURN_TOOL]
+
+    def classify(self, query: str, tool_texts: Sequence[str] = ()) -> Tuple[str, str]:
+        query = (query or "").strip()
+        for keyword in self.tool_keywords:
+            if keyword in query:
+                return TURN_TOOL, f"keyword {keyword}"
+
+        overlap = _tokens(query) & self._tool_tokens(tool_texts)
+        if len(overlap) >= self.min_tool_overlap:
+            return TURN_TOOL, f"catalog {sorted(overlap)[:3]}"
+
+        if len(query) > self.long_chars:
+            return TURN_COMPLEX, f"length {len(query)}"
+        return TURN_CHAT, f"length {len(query)}"
+
+    def route(self, query: str, tool_texts: Sequence[str] = ()) -> RouteDecision:
+        turn_class, reason = self.classify(query, tool_texts)
+        decision = RouteDecision(turn_class, self.model_for(turn_class), reason)
+        logger.debug(f"route {query!r} -> {decision}")
+        return decision
+
+    def record(self, turn_class: str, first_token: Optional[float], total: float):
+        self.stats.setdefault(turn_class, TierStats()).record(first_token, total)
+
+    def report(self) -> dict:
+        return {
+            turn_class: {"model": self.model_for(turn_class), **stats.summary()}
+            for turn_class, stats in self.stats.items()
+        }
+
+    def _tool_tokens(self, tool_texts: Sequence[str]) -> set:
+        # 工具目录很少变化，缓存上一次的分词结果
+        key = tuple(tool_texts)
+        if key != self._catalog_key:
+            tokens = set()
+            for text in key:
+                tokens |= _tokens(text)
+            self._catalog_key = key
+            self._catalog_tokens = tokens
+        return self._catalog_tokens
@@ -0,0 +1,144 @@
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+import anyio
+
+from .vision import current_device
+
+logger = logging.getLogger(__name__)
+
+# 明显需要看一眼的说法，匹配到就先拍照
+DEFAULT_VISUAL_PATTERNS = (
+    r"看看|看一下|看一眼|瞧瞧|帮我看",
+    r"打扮|穿搭|衣服|裤子|鞋子|发型|化妆|妆容|穿得|穿的",
+    r"拍(张|个|一张|一下)?(照|照片)|照片|相机|摄像头",
+    r"(这|那)(是|个是)什么|前面有什么|眼前|面前|手里",
+)
+
+
+@dataclass
+class _Prefetch:
+    started: float
+    done: anyio.Event = field(default_factory=anyio.Event)
+    finished: Optional[float] = None
+    result: Any = None
+    ok: bool = False
+    # 已被一次 take() 领走
+    claimed: bool = False
+
+
+class PhotoPrefetcher:
+    """
+    Speculative camera capture for utterances with a visual intent.
+
+    When the ASR text matches one of ``patterns``, :meth:`prefetch` runs the
+    capture concurrently with the LLM call; a later ``take_photo`` goes through
+    :meth:`take`, which returns the prefetched frame if it is still fresh
+    (waiting for it if the capture is in flight) and captures anew otherwise.
+    A prefetched frame serves at most one capture of the same device (see
+    :data:`current_device`) and expires ``ttl`` seconds after it was taken.
+
+    Args:
+        patterns: Regular expressions of visual-intent utterances
+        ttl: Seconds a prefetched frame stays usable
+        clock: Monotonic clock, replaceable for tests
+    """
+
+    def __init__(
+        self,
+        patterns: Sequence[str] = DEFAULT_VISUAL_PATTERNS,
+        ttl: float = 10.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.patterns = [re.compile(pattern) for pattern in patterns]
+        self.ttl = ttl
+        self.clock = clock
+        self.prefetches = 0
+        self.hits = 0
+        # 拍了但没用上：过期、被新的预取替换或拍照失败
+        self.wasted = 0
+        # 没有可用的预取、只能现拍的次数
+        self.misses = 0
+        # 每个设备最近一次预取
+        self._pending: Dict[str, _Prefetch] = {}
+
+    def matches(self, text: Optional[str]) -> bool:
+        return bool(text) and any(pattern.search(text) for pattern in self.patterns)
+
+    async def prefetch(self, capture: Callable[[], Awaitable[Any]]):
+        """Run ``capture`` and keep its result for the next :meth:`take`."""
+        device_id = current_device.get()
+        self._discard(device_id)
+        entry = self._pending[device_id] = _Prefetch(started=self.clock())
+        self.prefetches += 1
+        try:
+            entry.result = await capture()
+            entry.ok = entry.result is not False
+        except Exception as e:
+            logger.warning(f"photo prefetch failed: {e}")
+        finally:
+            entry.finished = self.clock()
+            entry.done.set()
+            current = self._pending.get(device_id) is entry
+            if current and not entry.ok:
+                del self._pending[device_id]
+            # 失败、被取消，或还在拍摄时就被丢弃
+            if not entry.ok or (not entry.claimed and not current):
+                self.wasted += 1
+
+    async def take(self, capture: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the fresh prefetched frame, else the result of ``capture``."""
+        device_id = current_device.get()
+        self._expire(device_id)
+        entry = self._pending.pop(device_id, None)
+        if entry is not None:
+            entry.claimed = True
+            await entry.done.wait()
+            if entry.ok:
+                self.hits += 1
+                logger.debug(
+                    f"use prefetched photo, capture took "
+                    f"{entry.finished - entry.started:.2f}s"
+                )
+                return entry.result
+            # 预取在等待期间失败，已计入 wasted
+        self.misses += 1
+        return await capture()
+
+    def _expire(self, device_id: str):
+        entry = self._pending.get(device_id)
+        if (
+            entry is not None
+            and entry.finished is not None
+            and self.clock() - entry.finished > self.ttl
+        ):
+            self._discard(device_id)
+
+    def _discard(self, device_id: str):
+        # 仍在拍摄的预取结束时再计入 wasted
+        entry = self._pending.pop(device_id, None)
+        if entry is not None and entry.finished is not None:
+            self.wasted += 1
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.prefetches if self.prefetches else 0.0
+
+    @property
+    def waste_rate(self) -> float:
+        return self.wasted / self.prefetches if self.prefetches else 0.0
+
+    def stats(self) -> dict:
+        for device_id in list(self._pending):
+            self._expire(device_id)
+        return {
+            "prefetches": self.prefetches,
+            "hits": self.hits,
+            "wasted": self.wasted,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "waste_rate": self.waste_rate,
+        }
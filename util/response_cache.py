@@ -0,0 +1,107 @@
+import hashlib
+import json
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+# 归一化时去掉的首尾标点（中英文）
+_PUNCTUATION = "。，！？、；：…～~.,!?;:\"'“”‘’()（）[]【】 \t\r\n"
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """NFKC-normalize, lowercase, collapse whitespace and strip edge punctuation."""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _WHITESPACE.sub(" ", text).strip(_PUNCTUATION)
+
+
+class ResponseCache:
+    """
+    Exact-match LRU/TTL cache for conversational replies.
+
+    Keys are a hash of the normalized system prompt, the tool catalog version,
+    the last ``context_turns`` user/assistant messages and the query, so a cached
+    reply is only reused in the same conversational context. Callers should only
+    store replies of turns that did not invoke tools.
+
+    Args:
+        max_entries: Maximum number of cached replies, least recently used are
+            evicted first
+        ttl: Seconds a reply stays valid
+        context_turns: Number of preceding user/assistant messages in the key
+        clock: Monotonic clock, replaceable for tests
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 600.0,
+        context_turns: int = 2,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.context_turns = context_turns
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        # key -> (过期时间, 回复)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def make_key(
+        self,
+        system_prompt: str,
+        tools_version: int,
+        history: Iterable,
+        query: str,
+    ) -> str:
+        context = []
+        if self.context_turns > 0:
+            for message in history:
+                content = getattr(message, "content", None)
+                if message.role in ("user", "assistant") and isinstance(content, str):
+                    context.append((message.role, normalize_text(content)))
+            context = context[-self.context_turns :]
+        raw = json.dumps(
+            [normalize_text(system_prompt), tools_version, context, normalize_text(query)],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > self.clock():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: str, response: str):
+        self._entries[key] = (self.clock() + self.ttl, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import keyword
+import logging
+import re
+from collections import OrderedDict
+from typing import Annotated, Any, Dict, List, Literal, Optional, Type, Union
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, create_model
+
+logger = logging.getLogger(__name__)
+
+_SIMPLE_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": float,
+    "boolean": bool,
+    "null": type(None),
+}
+
+# JSON Schema 约束 -> pydantic Field 参数
+_CONSTRAINTS = {
+    "minimum": "ge",
+    "maximum": "le",
+    "exclusiveMinimum": "gt",
+    "exclusiveMaximum": "lt",
+    "minLength": "min_length",
+    "maxLength": "max_length",
+    "minItems": "min_length",
+    "maxItems": "max_length",
+    "pattern": "pattern",
+}
+
+# 编译好的模型，按 (模型名, schema) 的内容哈希缓存
+_MAX_MODELS = 1024
+_models: "OrderedDict[str, Type[BaseModel]]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0}
+
+
+class ArgumentError(ValueError):
+    """Tool arguments do not match the tool's input schema."""
+
+
+def schema_hash(model_name: str, schema: Optional[dict]) -> str:
+    """Content hash of a JSON Schema; key order does not matter."""
+    canonical = json.dumps(
+        [model_name, schema or {}], sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def compile_schema(model_name: str, schema: Optional[dict]) -> Type[BaseModel]:
+    """
+    Compile a tool's JSON Schema into a typed pydantic model.
+
+    Types, enums and consts, nested objects, arrays, ``anyOf``/``oneOf`` and
+    the usual numeric, length and pattern constraints are mapped to real
+    pydantic types, so validating arguments also coerces them (``"5"`` for an
+    integer becomes ``5``). Unsupported keywords such as ``$ref`` fall back to
+    ``Any``. Properties are top-level fields; a field is required when listed
+    in ``required``.
+
+    Models are cached by :func:`schema_hash`, so compiling an unchanged
+    catalog again only costs the hashing.
+    """
+    key = schema_hash(model_name, schema)
+    model = _models.get(key)
+    if model is not None:
+        _models.move_to_end(key)
+        _stats["hits"] += 1
+        return model
+
+    _stats["misses"] += 1
+    model = _object_model(_class_name(model_name, "Params"), schema or {})
+    _models[key] = model
+    if len(_models) > _MAX_MODELS:
+        _models.popitem(last=False)
+    return model
+
+
+def validate_arguments(model: Type[BaseModel], arguments: Optional[dict]) -> dict:
+    """
+    Validate tool arguments against a compiled model and return them coerced
+    to their schema types, as JSON-ready values keyed by the original names.
+    Arguments the caller did not give stay absent, so the server applies its
+    own defaults. Raises :class:`ArgumentError` with a short message.
+    """
+    try:
+        validated = model.model_validate(arguments or {})
+    except ValidationError as e:
+        raise ArgumentError(_format_errors(e)) from None
+    return validated.model_dump(mode="json", by_alias=True, exclude_unset=True)
+
+
+def schema_cache_stats() -> dict:
+    return {"models": len(_models), **_stats}
+
+
+def _format_errors(error: ValidationError) -> str:
+    parts = []
+    for item in error.errors(include_url=False):
+        location = ".".join(str(part) for part in item["loc"]) or "arguments"
+        parts.append(f"{location}: {item['msg']}")
+    return "; ".join(parts)
+
+
+def _class_name(*parts: str) -> str:
+    return re.sub(r"\W+", "_", "_".join(part for part in parts if part))
+
+
+def _field_name(key: str, taken: set) -> str:
+    """Python attribute name of a property; the original name stays the alias."""
+    name = key
+    if (
+        not key.isidentifier()
+        or keyword.iskeyword(key)
+        or key.startswith("_")
+        or hasattr(BaseModel, key)
+    ):
+        name = "field_" + re.sub(r"\W+", "_", key).strip("_")
+    while name in taken:
+        name += "_"
+    taken.add(name)
+    return name
+
+
+def _object_model(name: str, schema: dict, typed: bool = True) -> Type[BaseModel]:
+    properties = schema.get("properties") or {}
+    required = set(schema.get("required") or [])
+    # 未声明的参数原样透传，除非 schema 明确禁止
+    extra = "forbid" if schema.get("additionalProperties") is False else "allow"
+
+    fields = {}
+    taken: set = set()
+    for key, prop in properties.items():
+        prop = prop if isinstance(prop, dict) else {}
+        annotation, kwargs = Any, {"description": prop.get("description")}
+        if typed:
+            try:
+                annotation = _annotation(_class_name(name, key), prop)
+                kwargs = _field_kwargs(prop)
+                if key not in required:
+                    annotation = Optional[annotation]
+            except Exception as e:
+                # 无法表达的 schema 不影响其余参数，退化为不校验
+                logger.warning(f"cannot compile schema of {name}.{key}: {e}")
+                annotation, kwargs = Any, {"description": prop.get("description")}
+        default = ... if key in required else prop.get("default")
+        field_name = _field_name(key, taken)
+        if field_name != key:
+            kwargs["alias"] = key
+        fields[field_name] = (annotation, Field(default, **kwargs))
+
+    try:
+        return create_model(
+            name,
+            __config__=ConfigDict(extra=extra, populate_by_name=True),
+            **fields,
+        )
+    except Exception as e:
+        if not typed:
+            raise
+        # 例如 pattern 不是合法的正则：只检查参数是否齐全
+        logger.warning(f"cannot compile schema of {name}, not typing it: {e}")
+        return _object_model(name, schema, typed=False)
+
+
+def _field_kwargs(schema: dict) -> dict:
+    kwargs = {}
+    if schema.get("description"):
+        kwargs["description"] = schema["description"]
+    for keyword_name, argument in _CONSTRAINTS.items():
+        value = schema.get(keyword_name)
+        # draft-04 的 exclusiveMinimum/Maximum 是布尔值
+        if value is not None and not isinstance(value, bool):
+            kwargs[argument] = value
+    return kwargs
+
+
+def _annotation(name: str, schema: dict) -> Any:
+    """Python type of a property schema."""
+    if "const" in schema:
+        return Literal[schema["const"]]
+    if schema.get("enum"):
+        return Literal[tuple(schema["enum"])]
+
+    for combinator in ("anyOf", "oneOf"):
+        options = schema.get(combinator)
+        if options:
+            return _union(
+                [
+                    _constrained(_class_name(name, str(i)), option)
+                    for i, option in enumerate(options)
+                    if isinstance(option, dict)
+                ]
+            )
+
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        return _union(
+            [_annotation(name, {**schema, "type": item}) for item in schema_type]
+        )
+
+    if schema_type in _SIMPLE_TYPES:
+        return _SIMPLE_TYPES[schema_type]
+    if schema_type == "array":
+        items = schema.get("items")
+        if isinstance(items, dict):
+            return List[_constrained(_class_name(name, "item"), items)]
+        return List[Any]
+    if schema_type == "object" or "properties" in schema:
+        if schema.get("properties"):
+            return _object_model(name, schema)
+        values = schema.get("additionalProperties")
+        if isinstance(values, dict):
+            return Dict[str, _constrained(_class_name(name, "value"), values)]
+        return Dict[str, Any]
+    return Any
+
+
+def _constrained(name: str, schema: dict) -> Any:
+    """Type of a nested schema, with its constraints attached."""
+    annotation = _annotation(name, schema)
+    kwargs = _field_kwargs(schema)
+    kwargs.pop("description", None)
+    if not kwargs:
+        return annotation
+    return Annotated[annotation, Field(**kwargs)]
+
+
+def _union(options: List[Any]) -> Any:
+    if not options:
+        return Any
+    if len(options) == 1:
+        return options[0]
+    return Union[tuple(options)]
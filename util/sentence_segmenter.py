@@ -0,0 +1,90 @@
+from typing import List, Optional
+
+# 句末标点；英文句点另行判断，避免切开 3.5、file.txt 之类
+_TERMINATORS = frozenset("。！？；…!?;\n")
+# 紧跟在句末标点后、应归入同一句的引号和括号
+_CLOSERS = frozenset("”’\"'）)」』】》")
+# 句子过长时可以断开的位置
+_SOFT_BREAKS = frozenset("，,、：:— \t")
+
+
+class SentenceSegmenter:
+    """
+    Incremental splitter of a streamed reply into sentences for TTS.
+
+    Text deltas are buffered and cut after Chinese or Western sentence-ending
+    punctuation, together with any closing quotes or brackets that follow it.
+    A candidate shorter than ``min_chars`` is merged with the next sentence so
+    TTS is not fed fragments; text reaching ``max_chars`` without an ending is
+    cut at the last comma or space, else hard at ``max_chars``.
+
+    A cut is made only once the character after the punctuation has arrived,
+    so a trailing sentence waits for :meth:`flush` at the end of the reply.
+
+    Args:
+        min_chars: Minimum length of an emitted sentence
+        max_chars: Maximum length of an emitted sentence
+    """
+
+    def __init__(self, min_chars: int = 4, max_chars: int = 50):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """Add a delta and return the sentences it completed."""
+        if not text:
+            return []
+        self._buffer += text
+        sentences = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            sentence = self._buffer[:cut].strip()
+            self._buffer = self._buffer[cut:]
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """Return the buffered rest of the reply, if any, and reset."""
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return rest or None
+
+    def _find_cut(self) -> Optional[int]:
+        buffer = self._buffer
+        length = len(buffer)
+        i = 0
+        while i < length:
+            char = buffer[i]
+            if char not in _TERMINATORS and char != ".":
+                i += 1
+                continue
+            end = i + 1
+            while end < length and (
+                buffer[end] in _TERMINATORS
+                or buffer[end] in _CLOSERS
+                or buffer[end] == "."
+            ):
+                end += 1
+            if end == length:
+                # 等下一个字符，看标点是否结束、句点后是否有空白
+                break
+            if char == "." and not buffer[end].isspace():
+                i = end
+                continue
+            if len(buffer[:end].strip()) >= self.min_chars:
+                return end
+            i = end
+
+        if len(buffer) > self.max_chars:
+            return self._soft_cut()
+        return None
+
+    def _soft_cut(self) -> int:
+        for i in range(self.max_chars - 1, self.min_chars - 1, -1):
+            if self._buffer[i] in _SOFT_BREAKS:
+                return i + 1
+        return self.max_chars
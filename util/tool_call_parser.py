@@ -0,0 +1,236 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOOL_CALL_START = "<tool_call>"
+TOOL_CALL_END = "</tool_call>"
+
+# 文本解析状态
+_TEXT = 0  # 普通文本
+_JSON = 1  # <tool_call> 之后的 JSON 体
+_AFTER = 2  # JSON 结束后，等待 </tool_call>
+
+
+def _partial_suffix_length(data: str, tag: str, start: int) -> int:
+    """data 末尾与 tag 前缀重合的最大长度（不含完整 tag）"""
+    for k in range(min(len(tag) - 1, len(data) - start), 0, -1):
+        if data.endswith(tag[:k]):
+            return k
+    return 0
+
+
+class StreamingToolCallParser:
+    """
+    Incremental parser for tool calls in a streamed LLM response.
+
+    Handles both native ``delta.tool_calls`` fragments and inline
+    ``<tool_call>{"name": ..., "arguments": ...}</tool_call>`` blocks in the
+    text. A call is emitted as soon as its JSON arguments are complete, so the
+    caller can start executing it while the rest of the response is still
+    streaming. Emitted calls are dicts with ``id``, ``name`` and ``arguments``
+    (a JSON string); ``id`` is None for inline calls.
+
+    Each chunk is scanned only once, so total work is linear in the response
+    length.
+    """
+
+    def __init__(self):
+        # 原始文本分片，仅追加，需要时再 join
+        self._parts: List[str] = []
+        self._state = _TEXT
+        # 可能是标签前缀、需要和下一个分片拼接后再判断的尾部
+        self._pending = ""
+        self._json_parts: List[str] = []
+        self._json_started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # 原生 tool_calls，按 index 累积
+        self._native: Dict[int, Dict[str, Any]] = {}
+        self._native_emitted: set = set()
+
+    @property
+    def content(self) -> str:
+        """目前收到的全部原始文本"""
+        return "".join(self._parts)
+
+    @property
+    def has_tool_call(self) -> bool:
+        """是否已出现（哪怕尚未完整的）工具调用"""
+        return bool(self._native) or self._state != _TEXT
+
+    def feed_content(self, content: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """Feed a text delta. Returns (visible text, completed inline calls)."""
+        self._parts.append(content)
+        data = self._pending + content
+        self._pending = ""
+        text: List[str] = []
+        calls: List[Dict[str, Any]] = []
+
+        pos = 0
+        while pos < len(data):
+            if self._state == _TEXT:
+                idx = data.find(TOOL_CALL_START, pos)
+                if idx == -1:
+                    keep = _partial_suffix_length(data, TOOL_CALL_START, pos)
+                    text.append(data[pos : len(data) - keep])
+                    self._pending = data[len(data) - keep :]
+                    break
+                text.append(data[pos:idx])
+                pos = idx + len(TOOL_CALL_START)
+                self._start_json()
+            elif self._state == _JSON:
+                end = self._scan_json(data, pos)
+                if end < 0:
+                    self._json_parts.append(data[pos:])
+                    break
+                if not self._json_started:
+                    # <tool_call> 后面不是 JSON 对象，按普通文本处理
+                    text.append(TOOL_CALL_START + "".join(self._json_parts))
+                    text.append(data[pos:end])
+                    pos = end
+                    self._state = _TEXT
+                    continue
+                self._json_parts.append(data[pos:end])
+                pos = end
+                call = self._finish_inline()
+                if call is not None:
+                    calls.append(call)
+                    self._state = _AFTER
+                else:
+                    text.append(TOOL_CALL_START + "".join(self._json_parts))
+                    self._state = _TEXT
+            else:
+                while pos < len(data) and data[pos].isspace():
+                    pos += 1
+                if pos >= len(data):
+                    break
+                if data.startswith(TOOL_CALL_END, pos):
+                    pos += len(TOOL_CALL_END)
+                    self._state = _TEXT
+                elif TOOL_CALL_END.startswith(data[pos:]):
+                    self._pending = data[pos:]
+                    break
+                else:
+                    # 缺少结束标签，直接回到普通文本
+                    self._state = _TEXT
+
+        return "".join(text), calls
+
+    def feed_tool_calls(self, tool_calls) -> List[Dict[str, Any]]:
+        """Feed native ``delta.tool_calls`` fragments. Returns completed calls."""
+        calls: List[Dict[str, Any]] = []
+        for tool_call in tool_calls:
+            index = tool_call.index if tool_call.index is not None else 0
+            if index not in self._native:
+                # 模型开始输出下一个调用，之前的调用必然已经完整
+                for prev in sorted(self._native):
+                    if prev < index:
+                        calls.extend(self._emit_native(prev))
+            part = self._native.setdefault(
+                index, {"id": None, "name": None, "arguments": []}
+            )
+            if tool_call.id is not None:
+                part["id"] = tool_call.id
+            function = tool_call.function
+            if function is not None:
+                if function.name is not None:
+                    part["name"] = function.name
+                if function.arguments:
+                    part["arguments"].append(function.arguments)
+            if self._native_complete(part):
+                calls.extend(self._emit_native(index))
+        return calls
+
+    def finish(self) -> Tuple[str, List[Dict[str, Any]]]:
+        """Flush at end of stream. Returns (remaining text, remaining calls)."""
+        text = ""
+        if self._state == _TEXT:
+            text = self._pending
+        elif self._state == _JSON:
+            text = TOOL_CALL_START + "".join(self._json_parts)
+            logger.error(f"unterminated tool call: {text}")
+        self._pending = ""
+        self._state = _TEXT
+
+        calls: List[Dict[str, Any]] = []
+        for index in sorted(self._native):
+            calls.extend(self._emit_native(index))
+        return text, calls
+
+    def _start_json(self):
+        self._state = _JSON
+        self._json_parts = []
+        self._json_started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def _scan_json(self, data: str, pos: int) -> int:
+        """扫描 JSON 对象，返回闭合 '}' 之后的位置；未闭合返回 -1"""
+        for i in range(pos, len(data)):
+            ch = data[i]
+            if not self._json_started:
+                if ch.isspace():
+                    continue
+                if ch != "{":
+                    return i
+                self._json_started = True
+                self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    return i + 1
+        return -1
+
+    def _finish_inline(self) -> Optional[Dict[str, Any]]:
+        raw = "".join(self._json_parts)
+        try:
+            data = json.loads(raw)
+            name = data["name"]
+        except (ValueError, KeyError, TypeError):
+            logger.error(f"invalid tool call: {raw}")
+            return None
+        arguments = data.get("arguments", {})
+        if not isinstance(arguments, str):
+            arguments = json.dumps(arguments, ensure_ascii=False)
+        return {"id": None, "name": name, "arguments": arguments}
+
+    @staticmethod
+    def _native_complete(part: Dict[str, Any]) -> bool:
+        if part["name"] is None or not part["arguments"]:
+            return False
+        # 只有以 '}' 结尾时才尝试解析，避免每个分片都做一次完整解析
+        if not part["arguments"][-1].rstrip().endswith("}"):
+            return False
+        try:
+            return isinstance(json.loads("".join(part["arguments"])), dict)
+        except ValueError:
+            return False
+
+    def _emit_native(self, index: int) -> List[Dict[str, Any]]:
+        part = self._native[index]
+        if index in self._native_emitted or part["name"] is None:
+            return []
+        self._native_emitted.add(index)
+        return [
+            {
+                "id": part["id"],
+                "name": part["name"],
+                "arguments": "".join(part["arguments"]),
+            }
+        ]
@@ -0,0 +1,293 @@
+import json
+import logging
+import math
+import re
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .dialogue import estimate_tokens
+from .model_router import _tokens
+
+logger = logging.getLogger(__name__)
+
+# 对模型没有用处的 schema 关键字
+_DROPPED_KEYS = frozenset(("title", "$schema", "$id", "$comment", "examples"))
+# 值为子 schema 字典（键是参数名等）的关键字
+_SCHEMA_MAPS = ("properties", "$defs", "definitions", "patternProperties")
+# 值为子 schema 列表的关键字
+_SCHEMA_LISTS = ("anyOf", "oneOf", "allOf", "prefixItems")
+_WORD = re.compile(r"[a-z0-9]+")
+_CJK = re.compile(r"[一-鿿]+")
+
+
+def minify_schema(schema):
+    """
+    Copy of a JSON Schema without what the model does not need.
+
+    Titles, ``$schema``/``$id``/``$comment``, examples and ``None`` defaults
+    are dropped, descriptions are collapsed to single spaces, and an optional
+    field's ``anyOf: [X, {"type": "null"}]`` becomes ``X``; whether the field
+    may be omitted is already said by ``required``.
+    """
+    if isinstance(schema, list):
+        return [minify_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+
+    options = schema.get("anyOf")
+    if isinstance(options, list) and len(options) == 2:
+        not_null = [option for option in options if option != {"type": "null"}]
+        if len(not_null) == 1 and isinstance(not_null[0], dict):
+            rest = {key: value for key, value in schema.items() if key != "anyOf"}
+            schema = {**not_null[0], **rest}
+
+    minified = {}
+    for key, value in schema.items():
+        if key in _DROPPED_KEYS or (key == "default" and value is None):
+            continue
+        if key == "description":
+            if not value:
+                continue
+            value = _collapse(value)
+        elif key in _SCHEMA_MAPS and isinstance(value, dict):
+            value = {name: minify_schema(item) for name, item in value.items()}
+        elif key in _SCHEMA_LISTS or key in ("items", "additionalProperties", "not"):
+            value = minify_schema(value)
+        minified[key] = value
+    return minified
+
+
+def minify_tool(tool: dict) -> dict:
+    """Copy of an OpenAI-format tool with its schema minified."""
+    function = tool.get("function") or {}
+    minified = {"name": function.get("name")}
+    if function.get("description"):
+        minified["description"] = _collapse(function["description"])
+    if function.get("parameters") is not None:
+        minified["parameters"] = minify_schema(function["parameters"])
+    return {"type": tool.get("type", "function"), "function": minified}
+
+
+def tool_tokens(tools: Sequence[dict]) -> int:
+    """Estimated prompt tokens of a tools list, see :func:`estimate_tokens`."""
+    return estimate_tokens(
+        json.dumps(list(tools), ensure_ascii=False, separators=(",", ":"))
+    )
+
+
+def _collapse(text) -> str:
+    return " ".join(str(text).split())
+
+
+@dataclass
+class ToolSelection:
+    """Tools sent in one turn; ``indices`` are positions in the catalog."""
+
+    indices: List[int]
+    tools: List[dict]
+    catalog_size: int
+    full_tokens: int
+    sent_tokens: int
+
+    @property
+    def names(self) -> List[str]:
+        return [tool["function"]["name"] for tool in self.tools]
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.full_tokens - self.sent_tokens
+
+
+@dataclass
+class _CatalogIndex:
+    names: List[str]
+    # 每个工具的关键词（名称中的词权重加倍）
+    keywords: List[Dict[str, float]]
+    idf: Dict[str, float]
+    vectors: np.ndarray
+    minified: List[dict]
+    tool_tokens: List[int]
+    full_tokens: int
+    # 按选中的位置复用 ToolSelection 的工具列表
+    subsets: Dict[tuple, List[dict]] = field(default_factory=dict)
+
+
+class ToolSelector:
+    """
+    Per-turn choice of the tools worth sending to the LLM.
+
+    Tool names and descriptions are indexed once per catalog: keyword tokens
+    weighted by inverse document frequency, and a hashed bag of tokens and
+    character n-grams as a small embedding, so no model is needed. A turn
+    scores every tool by keyword overlap with the utterance plus the cosine
+    similarity of the embeddings, and sends the ``top_k`` best tools scoring
+    above ``min_score`` together with the ``pinned`` ones, in catalog order and
+    with minified schemas (see :func:`minify_schema`). A catalog of at most
+    ``top_k`` tools besides the pinned ones is sent whole.
+
+    The index is kept for the catalog list object it was built from; callers
+    replace the list when tools change, they never mutate it.
+
+    Args:
+        top_k: Tools sent per turn besides the pinned ones
+        pinned: Names of tools sent in every turn
+        min_score: Tools scoring at most this are not sent
+        dimensions: Size of the hashed embedding
+        keyword_weight: Weight of the keyword score against the cosine
+    """
+
+    def __init__(
+        self,
+        top_k: int = 8,
+        pinned: Sequence[str] = (),
+        min_score: float = 0.2,
+        dimensions: int = 2048,
+        keyword_weight: float = 1.0,
+    ):
+        self.top_k = top_k
+        self.pinned = frozenset(pinned)
+        self.min_score = min_score
+        self.dimensions = dimensions
+        self.keyword_weight = keyword_weight
+        self.turns = 0
+        self.full_tokens = 0
+        self.sent_tokens = 0
+        self._catalog: Optional[Sequence[dict]] = None
+        self._index: Optional[_CatalogIndex] = None
+
+    def select(self, query: str, tools: Sequence[dict]) -> ToolSelection:
+        """Choose the tools of a turn from a catalog of OpenAI-format tools."""
+        index = self._index_of(tools)
+        count = len(index.names)
+        pinned = [i for i, name in enumerate(index.names) if name in self.pinned]
+
+        if count - len(pinned) <= self.top_k:
+            chosen = list(range(count))
+        else:
+            scores = self.scores(query, tools)
+            ranked = sorted(
+                (i for i in range(count) if index.names[i] not in self.pinned),
+                key=lambda i: -scores[i],
+            )
+            best = [i for i in ranked[: self.top_k] if scores[i] > self.min_score]
+            chosen = sorted({*pinned, *best})
+
+        key = tuple(chosen)
+        subset = index.subsets.get(key)
+        if subset is None:
+            subset = [index.minified[i] for i in chosen]
+            # 常见的组合不多，满了就清空
+            if len(index.subsets) >= 256:
+                index.subsets.clear()
+            index.subsets[key] = subset
+
+        selection = ToolSelection(
+            indices=chosen,
+            tools=subset,
+            catalog_size=count,
+            full_tokens=index.full_tokens,
+            sent_tokens=sum(index.tool_tokens[i] for i in chosen),
+        )
+        self.turns += 1
+        self.full_tokens += selection.full_tokens
+        self.sent_tokens += selection.sent_tokens
+        logger.info(
+            f"tools {len(chosen)}/{count}, prompt tokens "
+            f"{selection.sent_tokens}/{selection.full_tokens} "
+            f"(saved {selection.saved_tokens}): {selection.names}"
+        )
+        return selection
+
+    def scores(self, query: str, tools: Sequence[dict]) -> np.ndarray:
+        """Relevance of every catalog tool to ``query``."""
+        index = self._index_of(tools)
+        query_tokens = _tokens(query)
+        query_weight = sum(index.idf.get(token, 0.0) for token in query_tokens)
+
+        keyword = np.zeros(len(index.names))
+        if query_weight:
+            for i, weights in enumerate(index.keywords):
+                matched = sum(weights.get(token, 0.0) for token in query_tokens)
+                keyword[i] = matched / query_weight
+
+        return self.keyword_weight * keyword + index.vectors @ self._embed(query)
+
+    def stats(self) -> dict:
+        saved = self.full_tokens - self.sent_tokens
+        return {
+            "turns": self.turns,
+            "full_tokens": self.full_tokens,
+            "sent_tokens": self.sent_tokens,
+            "saved_tokens": saved,
+            "saved_rate": saved / self.full_tokens if self.full_tokens else 0.0,
+        }
+
+    def _index_of(self, tools: Sequence[dict]) -> _CatalogIndex:
+        if tools is self._catalog and self._index is not None:
+            return self._index
+
+        names, texts, keywords = [], [], []
+        frequency: Dict[str, int] = {}
+        for tool in tools:
+            function = tool.get("function") or {}
+            name = function.get("name") or ""
+            description = function.get("description") or ""
+            weights = {token: 1.0 for token in _tokens(description)}
+            # 名称里的词更能说明工具的用途
+            weights.update({token: 2.0 for token in _tokens(name.replace("_", " "))})
+            for token in weights:
+                frequency[token] = frequency.get(token, 0) + 1
+            names.append(name)
+            texts.append(f"{name.replace('_', ' ')} {description}")
+            keywords.append(weights)
+
+        count = len(names)
+        idf = {
+            token: math.log(1 + count / documents)
+            for token, documents in frequency.items()
+        }
+        keywords = [
+            {token: weight * idf[token] for token, weight in weights.items()}
+            for weights in keywords
+        ]
+        vectors = np.zeros((count, self.dimensions), dtype=np.float32)
+        for i, text in enumerate(texts):
+            vectors[i] = self._embed(text)
+
+        minified = [minify_tool(tool) for tool in tools]
+        self._catalog = tools
+        self._index = _CatalogIndex(
+            names=names,
+            keywords=keywords,
+            idf=idf,
+            vectors=vectors,
+            minified=minified,
+            tool_tokens=[tool_tokens([tool]) for tool in minified],
+            full_tokens=tool_tokens(tools),
+        )
+        logger.debug(f"tool index built: {count} tools")
+        return self._index
+
+    def _embed(self, text: str) -> np.ndarray:
+        """Signed feature hashing of tokens and character n-grams, L2 normalized"""
+        text = (text or "").lower().replace("_", " ")
+        features = {token: 1.0 for token in _tokens(text)}
+        # 字符 n-gram 让 light/lights、开灯/灯 这类说法也能相近
+        for word in _WORD.findall(text):
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                features.setdefault(padded[i : i + 3], 0.5)
+        for run in _CJK.findall(text):
+            for char in run:
+                features.setdefault(char, 0.5)
+
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature, weight in features.items():
+            digest = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.dimensions] += sign * weight
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
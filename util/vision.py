@@ -0,0 +1,233 @@
+import hashlib
+import logging
+from contextvars import ContextVar
+from typing import Optional, Sequence, Tuple
+
+import anyio
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from .blob_store import BlobStore
+from .deadline import remaining_budget
+from .frame_index import FrameIndex, image_hashes
+from .frame_quality import best_frame, score_frames
+from .image_preprocess import load_image_bytes, preprocess_image, to_data_url
+from .response_cache import ResponseCache, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# 当前对话所属的设备，按设备区分最近拍摄的照片
+current_device: ContextVar[str] = ContextVar("current_device", default="default")
+
+
+class VisionService:
+    """
+    Async client for the vision-language model behind ``explain_photo``.
+
+    One instance is meant to be shared by every conversation in the process:
+    it owns a single ``AsyncOpenAI`` client whose connection pool keeps TLS
+    connections alive between calls, and a capacity limiter bounding the number
+    of concurrent VLM requests. Requests never block the event loop, so a slow
+    vision call of one device does not stall the other conversations.
+
+    Images given as data URLs or local files under ``image_dir`` are downsized to ``max_edge`` and
+    re-encoded as JPEG in a worker thread before upload. Answers are cached by
+    (image content hash, normalized question); remote URLs are passed through
+    and keyed by the URL itself. With a ``frame_index`` an answer is also reused
+    for a near-identical frame of the same device (see :data:`current_device`).
+    ``blob://`` handles of tool results are resolved through ``blob_store``.
+
+    Args:
+        api_key: API key of the OpenAI-compatible endpoint
+        base_url: Base URL of the endpoint
+        model: Vision-language model name
+        max_concurrency: Maximum number of requests in flight
+        timeout: Seconds allowed for one request, further bounded by the
+            remaining turn budget (see :class:`TurnDeadline`)
+        keepalive_expiry: Seconds an idle connection is kept open
+        client: Prebuilt ``AsyncOpenAI`` client, overrides the connection args
+        max_edge: Longer edge of uploaded images in pixels, None keeps the size
+        jpeg_quality: JPEG quality of uploaded images
+        cache_size: Maximum number of cached answers, 0 disables the cache
+        cache_ttl: Seconds a cached answer stays valid
+        frame_index: Perceptual-hash index of recent frames, None disables it
+        blob_store: Store resolving ``blob://`` image handles
+        image_dir: Directory local image files may be read from, None refuses
+            local files (image URLs may come from the model)
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        model: str = "qwen-vl-plus",
+        max_concurrency: int = 4,
+        timeout: float = 30.0,
+        keepalive_expiry: float = 120.0,
+        client: Optional[AsyncOpenAI] = None,
+        max_edge: Optional[int] = 1024,
+        jpeg_quality: int = 80,
+        cache_size: int = 256,
+        cache_ttl: float = 600.0,
+        frame_index: Optional[FrameIndex] = None,
+        blob_store: Optional[BlobStore] = None,
+        image_dir: Optional[str] = None,
+    ):
+        self.model = model
+        self.timeout = timeout
+        self.max_edge = max_edge
+        self.jpeg_quality = jpeg_quality
+        self.cache = (
+            ResponseCache(max_entries=cache_size, ttl=cache_ttl, context_turns=0)
+            if cache_size > 0
+            else None
+        )
+        self.frame_index = frame_index
+        self.blob_store = blob_store
+        self.image_dir = image_dir
+        # 同一个连接池也用于下载远程图片
+        self.http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+                keepalive_expiry=keepalive_expiry,
+            )
+        )
+        self.client = client or AsyncOpenAI(
+            api_key=api_key, base_url=base_url, http_client=self.http_client
+        )
+        self.limiter = anyio.CapacityLimiter(max_concurrency)
+
+    async def explain(self, image_url: str, question: str) -> str:
+        """
+        Ask ``question`` about the image at a URL, data URL, local path under
+        ``image_dir`` or ``blob://`` handle.
+        """
+        if BlobStore.is_handle(image_url):
+            blob = self._blob(image_url)
+            return await self._explain(None, blob.data, blob.digest, question)
+        data, digest = await anyio.to_thread.run_sync(self._load, image_url)
+        return await self._explain(image_url, data, digest, question)
+
+    async def explain_image(self, data: bytes, question: str) -> str:
+        """Ask ``question`` about encoded image bytes, e.g. a fresh camera frame."""
+        digest = await anyio.to_thread.run_sync(self._digest, data)
+        return await self._explain(None, data, digest, question)
+
+    async def _explain(
+        self,
+        image_url: Optional[str],
+        data: Optional[bytes],
+        digest: str,
+        question: str,
+    ) -> str:
+        normalized = normalize_text(question)
+
+        key = None
+        if self.cache is not None:
+            key = f"{digest}:{normalized}"
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.debug(f"vision cache hit {digest[:12]}")
+                return cached
+
+        hashes = None
+        device_id = current_device.get()
+        if data is not None and self.frame_index is not None:
+            try:
+                hashes = await anyio.to_thread.run_sync(image_hashes, data)
+            except Exception as e:
+                logger.warning(f"perceptual hash failed: {e}")
+            else:
+                reused = self.frame_index.lookup(device_id, hashes, normalized)
+                if reused is not None:
+                    if key is not None:
+                        self.cache.put(key, reused)
+                    return reused
+
+        if data is not None:
+            data = await anyio.to_thread.run_sync(
+                preprocess_image, data, self.max_edge, self.jpeg_quality
+            )
+            image_url = to_data_url(data)
+
+        content = await self._ask(image_url, question)
+        if content:
+            if key is not None:
+                self.cache.put(key, content)
+            if hashes is not None:
+                self.frame_index.add(device_id, hashes, normalized, content)
+        return content
+
+    async def fetch_image(self, image_url: str) -> Optional[bytes]:
+        """Bytes of an image given as URL, data URL, local path or blob handle."""
+        if BlobStore.is_handle(image_url):
+            return self._blob(image_url).data
+        if image_url.startswith(("http://", "https://")):
+            response = await self.http_client.get(
+                image_url, timeout=max(0.0, min(self.timeout, remaining_budget()))
+            )
+            response.raise_for_status()
+            return response.content
+        return await anyio.to_thread.run_sync(
+            load_image_bytes, image_url, self.image_dir
+        )
+
+    async def best_frame(self, images: Sequence[Optional[bytes]]) -> Optional[int]:
+        """
+        Index of the sharpest well-exposed image of a burst, see
+        :func:`score_frames`; scoring runs in a worker thread.
+        """
+        scores = await anyio.to_thread.run_sync(score_frames, images)
+        logger.debug(f"burst scores: {scores}")
+        return best_frame(scores)
+
+    def _blob(self, handle: str):
+        blob = self.blob_store.get(handle) if self.blob_store is not None else None
+        if blob is None:
+            raise ValueError(f"image {handle} is no longer available")
+        return blob
+
+    @staticmethod
+    def _digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _load(self, image_url: str) -> Tuple[Optional[bytes], str]:
+        data = load_image_bytes(image_url, self.image_dir)
+        source = data if data is not None else image_url.encode("utf-8")
+        return data, self._digest(source)
+
+    async def _ask(self, image_url: str, question: str) -> str:
+        request_body = {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {"url": image_url},
+                },
+                {"type": "text", "text": question},
+            ],
+        }
+        async with self.limiter:
+            completion = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[request_body],
+                timeout=max(0.0, min(self.timeout, remaining_budget())),
+            )
+        # 提取第一个 choice 的 message.content 字段
+        content = ""
+        if completion.choices and hasattr(completion.choices[0], "message"):
+            content = completion.choices[0].message.content or ""
+        return content
+
+    def stats(self) -> dict:
+        return {
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "frame_index": (
+                self.frame_index.stats() if self.frame_index is not None else None
+            ),
+        }
+
+    async def aclose(self):
+        await self.client.close()
+        await self.http_client.aclose()